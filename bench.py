@@ -0,0 +1,341 @@
+import argparse
+import itertools
+import json
+import os
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from lib.events import EventMetrics, bus
+from lib.fixtures import FixtureServer, Synthesizer
+
+# Benchmarks the whole pipeline headlessly against the local fixture server
+# (see lib/fixtures.py), over a matrix of scenarios:
+#
+#   python bench.py --acts 1 3 --shots 3 10 --workers 1 4 --cache cold warm \
+#       --output bench_report.json --baseline bench_baseline.json
+#
+# Each scenario runs in its own process so peak RSS is measured per scenario.
+# With --baseline, the report is compared against a previous one and the exit
+# status is 1 if any metric got worse by more than --threshold.
+#
+#   python bench.py --startup
+#
+# reports what a cold start of the Streamlit page costs instead: how long
+# importing main.py and rendering the page for the first time take, and which
+# imports the time goes to.
+
+
+def summarize(durations):
+    ordered = sorted(durations) or [0.0]
+    return {
+        "count": len(durations),
+        "total": sum(ordered),
+        "mean": statistics.mean(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+def scenario_name(scenario):
+    return (
+        f"acts{scenario['acts']}-shots{scenario['shots']}"
+        f"-workers{scenario['workers']}-{scenario['cache']}"
+        + ("-compact" if scenario.get("compact") else "")
+    )
+
+
+# runs in the child process
+def run_scenario(scenario, workdir, fixtures_dir, llm_latency, image_latency):
+    server = FixtureServer(
+        fixtures_dir or os.path.join(workdir, "fixtures"),
+        mode="replay",
+        llm_latency=llm_latency,
+        image_latency=image_latency,
+        synthesizer=Synthesizer(shots=scenario["shots"]),
+    ).start()
+
+    # main.py reads these when it first builds its clients
+    os.environ.update(
+        {
+            "OPENAI_API_KEY": "bench",
+            "OPENAI_BASE_URL": server.openai_base_url,
+            "STABILITY_API_KEY": "bench",
+            "STABILITY_API_URL": server.stability_url,
+            "IMAGE_CACHE_DIR": os.path.join(workdir, "image_cache"),
+            "DERIVATIVE_CACHE_DIR": os.path.join(workdir, "derivatives"),
+            "LLM_CACHE": "1",
+            "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.sqlite"),
+            "OTEL_SDK_DISABLED": "true",
+        }
+    )
+    import main
+
+    main.scripts_dir = os.path.join(workdir, "scripts")
+
+    def run():
+        main.create_crewai_setup(
+            "bench",
+            "The Benchmark",
+            num_acts=scenario["acts"],
+            max_workers=scenario["workers"],
+            incremental=False,
+            compact=scenario.get("compact", False),
+        )
+
+    if scenario["cache"] == "warm":
+        run()
+
+    metrics = EventMetrics()
+    bus.subscribe(metrics)
+    start = time.perf_counter()
+    run()
+    wall_time = time.perf_counter() - start
+    server.stop()
+
+    return {
+        "scenario": scenario,
+        "wall_time": wall_time,
+        "setup": summarize(metrics.durations("setup")),
+        "tasks": {t["task"]: t["duration"] for t in metrics.tasks},
+        "llm_calls": summarize(metrics.durations("llm")),
+        "image_calls": summarize(metrics.durations("image")),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def startup_report(top=15):
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "OTEL_SDK_DISABLED": "true"}
+
+    # python -X importtime prints "self | cumulative | module" in microseconds,
+    # indented by how deeply the module was imported
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True,
+        text=True,
+        cwd=here,
+        env=env,
+    )
+    imports = []
+    for line in completed.stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match:
+            _, cumulative_us, indent, module = match.groups()
+            imports.append((module, int(cumulative_us) / 1e6, len(indent) // 2))
+
+    # the page's first render, in a fresh process
+    rendered = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import time; from streamlit.testing.v1 import AppTest; "
+            "start = time.perf_counter(); "
+            "AppTest.from_file('main.py', default_timeout=120).run(); "
+            "print(time.perf_counter() - start)",
+        ],
+        capture_output=True,
+        text=True,
+        cwd=here,
+        env=env,
+    )
+
+    return {
+        "import_main": next((t for m, t, _ in imports if m == "main"), None),
+        "first_render": (
+            float(rendered.stdout.split()[-1]) if rendered.returncode == 0 else None
+        ),
+        # the slowest imports made by main.py and the lib/ modules it imports
+        "imports": dict(
+            sorted(
+                (
+                    (module, seconds)
+                    for module, seconds, depth in imports
+                    if 0 < depth <= 2
+                ),
+                key=lambda item: -item[1],
+            )[:top]
+        ),
+    }
+
+
+def run_matrix(scenarios, args):
+    report = {"created": time.time(), "scenarios": {}}
+    for scenario in scenarios:
+        name = scenario_name(scenario)
+        print(f"Running {name}...", flush=True)
+        with tempfile.TemporaryDirectory() as workdir:
+            result_file = os.path.join(workdir, "result.json")
+            with open(os.path.join(workdir, "run.log"), "w") as log:
+                completed = subprocess.run(
+                    [
+                        sys.executable,
+                        os.path.abspath(__file__),
+                        "--run-scenario",
+                        json.dumps(scenario),
+                        "--workdir",
+                        workdir,
+                        "--result-file",
+                        result_file,
+                        "--llm-latency",
+                        str(args.llm_latency),
+                        "--image-latency",
+                        str(args.image_latency),
+                        *(["--fixtures", args.fixtures] if args.fixtures else []),
+                    ],
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                    cwd=os.path.dirname(os.path.abspath(__file__)),
+                )
+            if completed.returncode != 0:
+                with open(os.path.join(workdir, "run.log")) as log:
+                    print(log.read()[-4000:])
+                raise SystemExit(f"Scenario {name} failed")
+            with open(result_file) as f:
+                result = json.load(f)
+
+        report["scenarios"][name] = result
+        print(
+            f"  {result['wall_time']:.2f}s wall, "
+            f"{result['llm_calls']['count']} LLM calls, "
+            f"{result['image_calls']['count']} images, "
+            f"{result['peak_rss_mb']:.0f}MB peak RSS"
+        )
+    return report
+
+
+def metrics(result):
+    values = {
+        "wall_time": result["wall_time"],
+        "setup.total": result.get("setup", {}).get("total"),
+        "llm_calls.total": result["llm_calls"]["total"],
+        "image_calls.total": result["image_calls"]["total"],
+        "peak_rss_mb": result["peak_rss_mb"],
+    }
+    for task, duration in result["tasks"].items():
+        values[f"tasks.{task}"] = duration
+    return values
+
+
+# returns a list of (scenario, metric, baseline, current) that got worse
+def compare(report, baseline, threshold):
+    regressions = []
+    for name, result in report["scenarios"].items():
+        if name not in baseline["scenarios"]:
+            continue
+        baseline_metrics = metrics(baseline["scenarios"][name])
+        for metric, value in metrics(result).items():
+            before = baseline_metrics.get(metric)
+            if before and value is not None and value > before * (1 + threshold):
+                regressions.append((name, metric, before, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the movie pipeline.")
+    parser.add_argument("--acts", type=int, nargs="+", default=[3])
+    parser.add_argument("--shots", type=int, nargs="+", default=[5])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument(
+        "--cache", nargs="+", choices=["cold", "warm"], default=["cold", "warm"]
+    )
+    parser.add_argument(
+        "--compact",
+        nargs="+",
+        choices=["off", "on"],
+        default=["off"],
+        help="run later acts on summaries of earlier ones",
+    )
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--image-latency", type=float, default=1.0)
+    parser.add_argument(
+        "--fixtures", help="replay recorded fixtures from this directory"
+    )
+    parser.add_argument("--output", default="bench_report.json")
+    parser.add_argument("--baseline", help="report to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="fractional slowdown that counts as a regression",
+    )
+    parser.add_argument(
+        "--compare", help="compare this existing report instead of running"
+    )
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help="report the cost of importing main.py and its first render instead",
+    )
+    # used when running a single scenario in a child process
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        result = run_scenario(
+            json.loads(args.run_scenario),
+            args.workdir,
+            args.fixtures,
+            args.llm_latency,
+            args.image_latency,
+        )
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+        return
+
+    if args.startup:
+        report = startup_report()
+        print(f"import main: {report['import_main']:.2f}s")
+        if report["first_render"] is not None:
+            print(f"first render: {report['first_render']:.2f}s")
+        for module, seconds in report["imports"].items():
+            print(f"  {seconds:6.2f}s  {module}")
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+        return
+
+    if args.compare:
+        with open(args.compare) as f:
+            report = json.load(f)
+    else:
+        scenarios = [
+            {
+                "acts": acts,
+                "shots": shots,
+                "workers": workers,
+                "cache": cache,
+                "compact": compact == "on",
+            }
+            for acts, shots, workers, cache, compact in itertools.product(
+                args.acts, args.shots, args.workers, args.cache, args.compact
+            )
+        ]
+        report = run_matrix(scenarios, args)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for name, metric, before, after in regressions:
+            print(f"REGRESSION {name} {metric}: {before:.2f} -> {after:.2f}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+# acts are named in their file names, e.g. first_act_draft.md
+ACT_NAMES = ["first", "second", "third", "fourth", "fifth"]
@@ -0,0 +1,34 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+# mkstemp creates private files; give finished files the usual permissions
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+# Write a file so that readers only ever see the old contents or the complete
+# new contents: data goes to a temp file in the same directory, is fsynced,
+# and is then renamed over the destination. If the block raises, the temp file
+# is removed and the destination is left untouched. Pass fsync=False for
+# files that are cheap to rebuild and written often.
+@contextmanager
+def atomic_write(path, mode="wb", encoding=None, fsync=True):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o666 & ~_umask)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
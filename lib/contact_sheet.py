@@ -0,0 +1,174 @@
+import argparse
+import base64
+import glob
+import hashlib
+import html
+import json
+import mimetypes
+import os
+import shutil
+from collections import namedtuple
+from lib.acts import ACT_NAMES
+from lib.atomic import atomic_write
+from lib.derivatives import file_sha256
+from lib.shots import EMBEDDED_IMAGE, HEADING
+
+# where the rendered shots are kept between exports, in the movie directory
+FRAGMENTS_DIR = ".contact_sheets"
+
+# images are base64 encoded a piece at a time, in multiples of 3 bytes so the
+# pieces join up
+CHUNK_SIZE = 3 * 16 * 1024
+
+# One shot on a contact sheet: its title and prompt, and the file name of the
+# image shown, which is the image's preview if it has one.
+SheetShot = namedtuple("SheetShot", ["title", "caption", "image"])
+
+HEADER = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+.sheet {{
+  display: grid;
+  grid-template-columns: repeat(auto-fill, minmax(320px, 1fr));
+  gap: 1.5em;
+}}
+.shot {{ margin: 0; break-inside: avoid; }}
+.shot img {{ width: 100%; height: auto; }}
+.shot h2 {{ font-size: 1em; margin: 0.5em 0 0.25em; }}
+.shot figcaption p {{ font-size: 0.8em; margin: 0; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<div class="sheet">
+"""
+
+FOOTER = """</div>
+</body>
+</html>
+"""
+
+
+# The shots of a storyboard made by lib.shots.illustrate, in order.
+def parse_storyboard_images(markdown):
+    shots = []
+    title, lines, image = None, [], None
+
+    def add():
+        if title is not None and image is not None:
+            shots.append(SheetShot(title, " ".join(lines), image.group("preview")))
+
+    for line in markdown.splitlines():
+        heading = HEADING.match(line)
+        embedded = EMBEDDED_IMAGE.search(line)
+        if heading:
+            add()
+            title, lines, image = heading.group(1), [], None
+        elif embedded:
+            image = image or embedded
+        elif line.strip():
+            lines.append(line.strip())
+    add()
+    return shots
+
+
+# Writes the storyboard of act, from <act>_act_images.md, into one
+# self-contained HTML page, <act>_act_contact_sheet.html, with every image
+# embedded and captioned in storyboard order, and returns its path, or None if
+# the act hasn't been illustrated.
+#
+# Each shot is rendered into a fragment of its own, kept under FRAGMENTS_DIR
+# and keyed by its caption and image, and the page is put together by copying
+# the fragments into it one by one, so no more than a piece of one image is in
+# memory at a time. Re-exporting after a shot changes only renders that shot
+# again, and the page isn't rewritten at all if no shot changed.
+def export_contact_sheet(movie_dir, act, title=None):
+    storyboard_path = os.path.join(movie_dir, f"{act}_act_images.md")
+    if not os.path.exists(storyboard_path):
+        return None
+    with open(storyboard_path) as f:
+        shots = parse_storyboard_images(f.read())
+
+    title = title or f"{act.capitalize()} act storyboard"
+    fragments_dir = os.path.join(movie_dir, FRAGMENTS_DIR, act)
+    if not os.path.exists(fragments_dir):
+        os.makedirs(fragments_dir)
+
+    fragments = []
+    for shot in shots:
+        image_path = os.path.join(movie_dir, shot.image)
+        if not os.path.exists(image_path):
+            print(f"Skipping {shot.title}, its image {shot.image} is missing")
+            continue
+        key = hashlib.sha256(
+            json.dumps([shot.title, shot.caption, file_sha256(image_path)]).encode()
+        ).hexdigest()
+        fragment = os.path.join(fragments_dir, f"{key}.html")
+        if not os.path.exists(fragment):
+            with atomic_write(fragment, "w", encoding="utf-8", fsync=False) as f:
+                write_shot(f, shot, image_path)
+        fragments.append(fragment)
+
+    # the page only changes when its title or any of its fragments do
+    sheet_path = os.path.join(movie_dir, f"{act}_act_contact_sheet.html")
+    index_path = os.path.join(fragments_dir, "index.json")
+    index = {"title": title, "fragments": [os.path.basename(f) for f in fragments]}
+    try:
+        with open(index_path) as f:
+            previous = json.load(f)
+    except (FileNotFoundError, ValueError):
+        previous = None
+
+    if previous != index or not os.path.exists(sheet_path):
+        with atomic_write(sheet_path, "w", encoding="utf-8") as sheet:
+            sheet.write(HEADER.format(title=html.escape(title)))
+            for fragment in fragments:
+                with open(fragment, encoding="utf-8") as f:
+                    shutil.copyfileobj(f, sheet)
+            sheet.write(FOOTER)
+        with atomic_write(index_path, "w", fsync=False) as f:
+            json.dump(index, f)
+
+    # fragments of shots that have since changed or gone
+    for path in glob.glob(os.path.join(fragments_dir, "*.html")):
+        if path not in fragments:
+            os.remove(path)
+    return sheet_path
+
+
+def write_shot(f, shot, image_path):
+    mime_type = mimetypes.guess_type(image_path)[0] or "application/octet-stream"
+    f.write(f'<figure class="shot">\n<img alt="{html.escape(shot.title)}" ')
+    f.write(f'src="data:{mime_type};base64,')
+    with open(image_path, "rb") as image:
+        for chunk in iter(lambda: image.read(CHUNK_SIZE), b""):
+            f.write(base64.b64encode(chunk).decode("ascii"))
+    f.write('">\n<figcaption>\n')
+    f.write(f"<h2>{html.escape(shot.title)}</h2>\n")
+    f.write(f"<p>{html.escape(shot.caption)}</p>\n")
+    f.write("</figcaption>\n</figure>\n")
+
+
+# Exports the contact sheet of every act of the movie in movie_dir that has
+# been illustrated, and returns their paths.
+def export_contact_sheets(movie_dir, acts):
+    paths = [export_contact_sheet(movie_dir, act) for act in acts]
+    return [path for path in paths if path is not None]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export each act's storyboard into a single HTML contact sheet."
+    )
+    parser.add_argument("movie_dir", help="e.g. scripts/the_heist")
+    parser.add_argument(
+        "--acts", nargs="+", default=ACT_NAMES, help="which acts to export"
+    )
+    args = parser.parse_args()
+
+    for path in export_contact_sheets(args.movie_dir, args.acts):
+        print(f"Wrote {path}")
@@ -0,0 +1,647 @@
+import functools
+import hashlib
+import os
+import string
+from collections import namedtuple
+from crewai import Agent, Task, Crew, Process
+from lib.acts import ACT_NAMES
+from lib.crew_runner import Stage, own_callbacks, run_crew
+from lib.doc_tools import ListDocumentsTool, ReadSectionTool, SearchDocumentsTool
+from lib.documents import DocumentStore
+from lib.events import agent_step_callback, bus, current_run_id
+from lib.manifest import Manifest
+from lib.scheduler import check_acyclic
+from lib.search import SearchIndex
+from lib.registry import REGISTRY_FORMAT, Registry, parse_registry
+from lib.sd3 import ImageStylePresets
+from lib.shots import Shot, illustrate, storyboard_shots
+from lib.storyboard import SHOT_FORMAT, Storyboard, parse_storyboard
+
+# The long-lived objects every movie shares: the LLMs (an LLMRegistry, see
+# lib/llm_backends.py) and their event handler, the image generator, the caches
+# behind them and the image derivatives (see lib/derivatives.py), or None.
+# They are built once per process (see clients() in main.py) and reused by
+# every run.
+Clients = namedtuple(
+    "Clients",
+    [
+        "llms",
+        "llm_cache",
+        "llm_events",
+        "image_cache",
+        "sd3",
+        "derivatives",
+    ],
+    defaults=[None],
+)
+
+# An agent, with str.format templates for its goal and backstory.
+AgentSpec = namedtuple(
+    "AgentSpec", ["name", "role", "goal", "backstory", "allow_delegation"]
+)
+
+# A task, with templates for its description, expected_output and output_file
+# (relative to the movie directory). context names the tasks it builds on.
+#
+# A per_act task is repeated for every act, with {act} set to the act's name.
+# Its context can name other per_act tasks, meaning that task for the same act,
+# and with chain=True each act also builds on this task for every act before
+# it.
+#
+# When a crew is built with compact=True, tasks that build on another act's
+# output get that act's summary instead, made by the per_act task named in
+# summary. Tasks marked compact_only only exist to make those summaries.
+# context_tokens caps how much upstream output the task is given, overriding
+# the crew's default budget.
+#
+# A task with a stage runs locally instead of through an agent: its agent is
+# None, and stage names the function given to CrewTemplate.crew that turns
+# the outputs of its context into its output, called as fn(outputs, act=act)
+# (see lib.crew_runner.Stage).
+TaskSpec = namedtuple(
+    "TaskSpec",
+    [
+        "name",
+        "description",
+        "expected_output",
+        "agent",
+        "output_file",
+        "context",
+        "per_act",
+        "chain",
+        "summary",
+        "compact_only",
+        "context_tokens",
+        "stage",
+    ],
+    defaults=[(), False, False, None, False, None, None],
+)
+
+# what the templates can refer to
+MOVIE_PARAMS = {
+    "movie_name",
+    "movie_genre",
+    "movie_idea",
+    "movie_dir",
+    "storyboard_visual_style",
+    "summary_words",
+}
+ACT_PARAMS = {"act"}
+
+
+# A crew's agents and task graph, checked once and then turned into a Crew for
+# any number of movies. Every template's placeholders, agent and context names
+# are validated up front, and the graph is checked for cycles, so a mistake
+# fails at import rather than halfway through a run.
+#
+# crew_agents names the agents that make up the crew, and so can be delegated
+# to, in order. It defaults to all of them.
+class CrewTemplate:
+    def __init__(self, agents, tasks, crew_agents=None):
+        self.agents = list(agents)
+        self.tasks = list(tasks)
+
+        agent_names = {agent.name for agent in self.agents}
+        if len(agent_names) != len(self.agents):
+            raise ValueError("Agent names must be unique")
+        self.crew_agents = list(crew_agents or [agent.name for agent in self.agents])
+        for name in self.crew_agents:
+            if name not in agent_names:
+                raise ValueError(f"Unknown crew agent {name}")
+        for agent in self.agents:
+            for template in (agent.goal, agent.backstory):
+                self._check_fields(agent.name, template, MOVIE_PARAMS)
+
+        self._specs = {}
+        for task in self.tasks:
+            if task.name in self._specs:
+                raise ValueError(f"Task {task.name} is defined twice")
+            if task.stage is not None:
+                if task.agent is not None:
+                    raise ValueError(f"Stage {task.name} can't have an agent")
+            elif task.agent not in agent_names:
+                raise ValueError(f"Task {task.name} has unknown agent {task.agent}")
+            if task.chain and not task.per_act:
+                raise ValueError(f"Task {task.name} can only chain if it's per_act")
+            allowed = MOVIE_PARAMS | (ACT_PARAMS if task.per_act else set())
+            for template in (task.description, task.expected_output, task.output_file):
+                self._check_fields(task.name, template, allowed)
+            self._specs[task.name] = task
+
+        for task in self.tasks:
+            for name in task.context:
+                if name not in self._specs:
+                    raise ValueError(f"Task {task.name} builds on unknown task {name}")
+            if task.summary is not None:
+                summary = self._specs.get(task.summary)
+                if not (task.per_act and summary is not None and summary.per_act):
+                    raise ValueError(
+                        f"Task {task.name} must be per_act and summarized by a "
+                        "per_act task"
+                    )
+
+        # expanding the graph for a couple of acts, with and without summaries,
+        # catches cycles such as a summary that builds on a later act
+        for compact in (False, True):
+            graph = self._expand(ACT_NAMES[:2], compact)
+            index = {key: i for i, (key, _) in enumerate(graph)}
+            check_acyclic(
+                [key for key, _ in graph],
+                [[index[dep] for dep in context] for _, context in graph],
+            )
+
+    def _check_fields(self, name, template, allowed):
+        try:
+            fields = {
+                field for _, field, _, _ in string.Formatter().parse(template) if field
+            }
+        except ValueError as e:
+            raise ValueError(f"Bad template in {name}: {e}")
+        unknown = fields - allowed
+        if unknown:
+            raise ValueError(f"Unknown placeholders in {name}: {sorted(unknown)}")
+
+    # The tasks to build for these acts, as (task name, act) keys in order,
+    # each with the keys of the tasks it builds on. act is None for tasks that
+    # aren't per_act.
+    def _expand(self, acts, compact):
+        def other_act(spec, act):
+            # another act's output, or its summary when compacting
+            if compact and spec.summary is not None:
+                return (spec.summary, act)
+            return (spec.name, act)
+
+        graph = []
+        for spec in self.tasks:
+            if spec.compact_only and not compact:
+                continue
+            for act in acts if spec.per_act else [None]:
+                context = []
+                for name in spec.context:
+                    upstream = self._specs[name]
+                    if not upstream.per_act:
+                        context.append((name, None))
+                    elif act is not None:
+                        context.append((name, act))
+                    else:
+                        context.extend(other_act(upstream, a) for a in acts)
+                if spec.chain:
+                    context.extend(
+                        other_act(spec, earlier) for earlier in acts[: acts.index(act)]
+                    )
+                graph.append(((spec.name, act), context))
+
+        # the last act's summary is of no use to anyone
+        needed = {dep for _, context in graph for dep in context}
+        return [
+            (key, context)
+            for key, context in graph
+            if key in needed or not self._specs[key[0]].compact_only
+        ]
+
+    # Builds the Crew for one movie. Each agent runs on the LLM llms routes its
+    # name to, and is given tools. stages maps the stage names tasks use to
+    # their functions. With compact=True, tasks get summaries of other acts
+    # rather than their full text.
+    def crew(
+        self,
+        llms,
+        params,
+        acts,
+        tools,
+        step_callback=None,
+        compact=False,
+        stages=None,
+    ):
+        agents = {
+            spec.name: Agent(
+                role=spec.role,
+                goal=spec.goal.format(**params),
+                backstory=spec.backstory.format(**params),
+                verbose=True,
+                allow_delegation=spec.allow_delegation,
+                tools=list(tools),
+                llm=own_callbacks(llms.route(spec.name)),
+            )
+            for spec in self.agents
+        }
+
+        graph = self._expand(acts, compact)
+        built = {}
+        for (name, act), _ in graph:
+            spec = self._specs[name]
+            task_params = {**params, "act": act}
+            fields = {
+                "description": spec.description.format(**task_params),
+                "expected_output": spec.expected_output.format(**task_params),
+                "output_file": f"{params['movie_dir']}/"
+                + spec.output_file.format(**task_params),
+            }
+            if spec.stage is not None:
+                if spec.stage not in (stages or {}):
+                    raise ValueError(f"No function for stage {spec.stage}")
+                built[(name, act)] = Stage(
+                    **fields, run=functools.partial(stages[spec.stage], act=act)
+                )
+                continue
+            built[(name, act)] = Task(**fields, agent=agents[spec.agent])
+        # tasks can build on tasks that come after them in the list, e.g. an
+        # act on the summary of the one before, so context is set afterwards
+        for key, context in graph:
+            if context:
+                built[key].context = [built[dep] for dep in context]
+
+        return Crew(
+            agents=[agents[name] for name in self.crew_agents],
+            tasks=list(built.values()),
+            verbose=2,
+            process=Process.sequential,
+            step_callback=step_callback,
+        )
+
+    # How many tokens of upstream output each task (by output_file) may be
+    # given: the task's own context_tokens, or default.
+    def context_budgets(self, params, acts, default=None, compact=False):
+        budgets = {}
+        for (name, act), _ in self._expand(acts, compact):
+            spec = self._specs[name]
+            budget = spec.context_tokens or default
+            if budget:
+                output_file = spec.output_file.format(**params, act=act)
+                budgets[f"{params['movie_dir']}/{output_file}"] = budget
+        return budgets
+
+    # The LLM for each task (by output_file) that llms routes away from its
+    # agent's, e.g. storyboards on a cheaper model than the rest of the
+    # director's work.
+    def task_llms(self, llms, params, acts, compact=False):
+        routed = {}
+        for (name, act), _ in self._expand(acts, compact):
+            spec = self._specs[name]
+            if spec.stage is not None:
+                continue
+            backend = llms.backend_for(spec.name, spec.agent)
+            if backend != llms.backend_for(spec.agent):
+                output_file = spec.output_file.format(**params, act=act)
+                routed[f"{params['movie_dir']}/{output_file}"] = llms.llm(backend)
+        return routed
+
+
+MOVIE_AGENTS = [
+    AgentSpec(
+        "screenwriter",
+        "Screenwriter",
+        """Establish the premise, setting and write the dialog for {movie_name}, and integrate any feedback. You run the writers room and debate the best way to approproach the story.""",
+        """Your name is Daniel Walmsley. You are the writer for "{movie_name}". You are a master in the {movie_genre} genre. Your inspirations are Shakespeare and Quentin Tarantino.""",
+        True,
+    ),
+    AgentSpec(
+        "cinematographer",
+        "Cinematographer",
+        """Create a visual style for {movie_name} based on the treatment provided by the screenwriter. You will be responsible for the look and feel of the movie.""",
+        """You are the cinematographer for "{movie_name}". Your inspirations are Roger Deakins and Emmanuel Lubezki.""",
+        True,
+    ),
+    AgentSpec(
+        "script_consultant",
+        "Script Consultant",
+        """Provide feedback on the script for {movie_name} and suggest improvements.""",
+        """You are a script consultant for "{movie_name}". Your inspirations are Nora Ephron and David Mamet.""",
+        True,
+    ),
+    AgentSpec(
+        "writer",
+        "Writer",
+        """Write the dialog for {movie_name} based on the outline provided by the screenwriter. You will also be responsible for integrating any feedback.""",
+        """You are a writer for "{movie_name}". Your inspirations are J.K. Rowling and Aaron Sorkin.""",
+        False,
+    ),
+    AgentSpec(
+        "director",
+        "Director",
+        """Turn the script for "{movie_name}" into storyboards, and plan the shots and angles for the film. You will also be responsible for casting and overseeing the production.""",
+        """You are the director for "{movie_name}". Your inspirations are Steven Spielberg and Alfred Hitchcock.""",
+        True,
+    ),
+    AgentSpec(
+        "producer",
+        "Producer",
+        """Ensure that "{movie_name}" has all the elements it needs to be successful, including marketing materials and product placement.""",
+        """You are the producer for "{movie_name}". Your inspirations are Jerry Bruckheimer and Kathleen Kennedy.""",
+        True,
+    ),
+]
+
+MOVIE_TASKS = [
+    TaskSpec(
+        "define_plot",
+        """Establish the plot, setting, and characters for {movie_name}, in the {movie_genre} genre. In brief, the main idea is: {movie_idea}.""",
+        "A one-pager with the title, subtitle (if any), plot, setting, and characters for the movie. Ask the script consultant for any feedback and integrate it into your work.",
+        "screenwriter",
+        "idea_final.md",
+    ),
+    TaskSpec(
+        "write_treatment",
+        """\
+            Write a treatment for {movie_name} based on the plot, setting, and characters in the {movie_genre} genre based on the file {movie_dir}/idea_final.md.
+            Consult with the script consultant and writer to integrate any feedback. Be sure it remains true to the original idea: {movie_idea}
+        """,
+        "A concise treatment for the movie, no more than 10 pages, including title, logline, characters and synopsis. Also be sure to include a detailed description of the art style, color scheme, etc.",
+        "screenwriter",
+        "treatment.md",
+        context=["define_plot"],
+    ),
+    # TaskSpec(
+    #     "director_review_treatment",
+    #     """Review the treatment for {movie_name} and provide feedback based on the file in {movie_dir}/treatment_draft.md. Ensure that the movie will be cinematic, moving, funny and suspenseful.""",
+    #     "Feedback on the treatment for the movie.",
+    #     "director",
+    #     "treatment_review.md",
+    #     context=["write_treatment"],
+    # ),
+    # TaskSpec(
+    #     "treatment_final",
+    #     """Finalize the treatment for {movie_name} based on the feedback in the file {movie_dir}/treatment_review.md. Ensure that the movie will be cinematic, moving, funny and suspenseful.""",
+    #     "The final treatment for the movie.",
+    #     "screenwriter",
+    #     "treatment_final.md",
+    #     context=["write_treatment", "director_review_treatment"],
+    # ),
+    TaskSpec(
+        "write_lookbook",
+        """Create a lookbook for the visual style of {movie_name} based on the treatment in the file {movie_dir}/treatment.md. Include images, color schemes, art style, and any other visual references that will help the cinematographer and director. In place of actual images include extremely detailed visual descriptions. Be sure to include the visual style - e.g. cartoon, 3d animation, live action, etc.""",
+        "A lookbook for the visual style of the movie.",
+        "cinematographer",
+        "lookbook.md",
+        context=["write_treatment"],
+    ),
+    # every image prompt refers to the characters and locations by key, and
+    # they're described in the same words each time they're painted
+    TaskSpec(
+        "write_registry",
+        """Based on the overview of {movie_name} in {movie_dir}/idea_final.md and the lookbook in {movie_dir}/lookbook.md, write the canonical visual description of every recurring character and location in the movie, and of its visual style, for the artists painting the storyboards in the {storyboard_visual_style} style.
+            Give each character and location a short lowercase key, like "john" or "rooftop_bar".
+            Describe each character's full name, age, build, face, hair and clothing, like "John Smith, a tall man in his forties with long brown hair, pale skin, a pointed nose and a long brown coat".
+            Describe each location's setting, architecture, lighting and mood, like "a gothic noir cityscape with neon lights and rain".
+            Describe the style's tone, color palette and rendering, like "dark and moody, deep blues and neon pinks, heavy ink outlines".""",
+        "The registry, laid out exactly like this:\n\n" + REGISTRY_FORMAT,
+        "cinematographer",
+        "registry.md",
+        context=["define_plot", "write_lookbook"],
+    ),
+    TaskSpec(
+        "structure_registry",
+        "Read the registry into a validated list of characters and locations.",
+        "The registry as JSON.",
+        None,
+        "registry.json",
+        context=["write_registry"],
+        stage="structure_registry",
+    ),
+    # each act builds on the treatment and every act before it
+    TaskSpec(
+        "write_act",
+        """Write the {act} act script for {movie_name} based on the treatment in the file {movie_dir}/treatment.md, in the {movie_genre} genre. Consult with the screenwriter, script consultant, and director to integrate any feedback.""",
+        "The complete {act} act of the movie script.",
+        "screenwriter",
+        "{act}_act_draft.md",
+        context=["write_treatment"],
+        per_act=True,
+        chain=True,
+        summary="summarize_act",
+    ),
+    # with compact=True, later acts read these summaries instead of the full
+    # text of every act before them
+    TaskSpec(
+        "summarize_act",
+        """Summarize the {act} act of the script for {movie_name} for the writers of the acts that follow it. Keep every plot point, character introduction and change, setting, open thread and the state the act leaves the story in, and drop the dialog and scene detail.""",
+        "A summary of the {act} act in no more than {summary_words} words.",
+        "writer",
+        "{act}_act_summary.md",
+        context=["write_act"],
+        per_act=True,
+        compact_only=True,
+    ),
+    TaskSpec(
+        "storyboard_act",
+        """Create a storyboard for the {act} act of {movie_name} based on the {act} act. Descrbe each scene as its own numbered shot, as if describing the frames on the storyboard. Make the descriptions rich enough for our artists to paint the scenes, with angle, pose, and detailed character information.""",
+        "Storyboard for the {act} act of the movie, with every shot laid out exactly like this:\n\n"
+        + SHOT_FORMAT,
+        "director",
+        "{act}_act_storyboard_draft.md",
+        context=["write_act"],
+        per_act=True,
+        chain=True,
+        summary="summarize_storyboard",
+    ),
+    # the same storyboard as a validated shot list, for what comes after
+    TaskSpec(
+        "structure_storyboard",
+        "Read the shots of the {act} act storyboard into a validated shot list.",
+        "The {act} act storyboard as JSON.",
+        None,
+        "{act}_act_storyboard.json",
+        context=["storyboard_act"],
+        per_act=True,
+        stage="structure_storyboard",
+    ),
+    TaskSpec(
+        "summarize_storyboard",
+        """Summarize the storyboard for the {act} act of {movie_name} for the directors of the storyboards that follow it. Keep the list of scenes, the recurring characters and locations with how they look, and the visual conventions the storyboard has established.""",
+        "A summary of the {act} act storyboard in no more than {summary_words} words.",
+        "writer",
+        "{act}_act_storyboard_summary.md",
+        context=["storyboard_act"],
+        per_act=True,
+        compact_only=True,
+    ),
+    # one pass writes every shot's image prompt, and the images are then
+    # painted in a single batch without going back to the agent for each one
+    TaskSpec(
+        "envision_act",
+        """Write the image prompts for a storyboard of the {act} act of {movie_name} based on the storyboard in {act}_act_storyboard_draft.md, one for every scene in it.
+            The style of the images is {storyboard_visual_style}.
+            Also consult the overview of the movie in idea_final.md and the lookbook in lookbook.md.
+            Each prompt is painted on its own, without the others, so every prompt must stand alone and carry all the details of its image that the registry doesn't.
+            The characters, locations and visual style are described once, in the registry in registry.md. Refer to a character as {{char:<key>}} and a location as {{loc:<key>}}, using their keys from the registry, like "{{char:john}} points at the sky from {{loc:rooftop_bar}}", and the full description is filled in when the image is painted. Do not describe them again or describe the visual style in the prompts.
+            Describe anything in a shot that isn't in the registry, like a character's expression or a change of clothes, in the prompt itself.
+            Include specific camera and framing details like "from above" or "close-up" or "wide shot".
+            Clearly describe what is in the foreground, what is in the background, and any costumers or other details that are important.
+            Clearly describe the relationship between the characters, for example whether one is pointing at another, or one is looking at another, or standing in front or behind the other.
+            Include a prompt for every shot in the storyboard, under the same "## Shot <number>" heading the shot has there. Do not skip any shots. Do not repeat any shots.
+            Where necessary, add a text bubble by saying "a speech bubble over {{char:<key>}}'s head says 'I am a robot'".
+            DO NOT SKIP ANY DETAILS of what happens in each shot.""",
+        "A shot list in markdown: for every shot in the storyboard, its '## Shot <number>' heading, followed by a single paragraph with the complete image prompt for that shot, and nothing else. Do NOT wrap it in a code block.",
+        "director",
+        "{act}_act_shots.md",
+        context=[
+            "write_treatment",
+            "write_lookbook",
+            "write_registry",
+            "storyboard_act",
+        ],
+        per_act=True,
+    ),
+    TaskSpec(
+        "illustrate_act",
+        "Paint an image in the {storyboard_visual_style} style for every shot in the {act} act shot list, and put them together into the storyboard.",
+        "Storyboard for the {act} act of the movie in markdown format with shot title, scene description and full embedded image.",
+        None,
+        "{act}_act_images.md",
+        # the treatment and lookbook are here because the prompts depend on them
+        context=[
+            "envision_act",
+            "structure_storyboard",
+            "structure_registry",
+            "write_treatment",
+            "write_lookbook",
+        ],
+        per_act=True,
+        stage="illustrate",
+    ),
+]
+
+# checked once, when this module is imported. The cinematographer only works
+# on the lookbook, and isn't someone the others delegate to.
+MOVIE_TEMPLATE = CrewTemplate(
+    MOVIE_AGENTS,
+    MOVIE_TASKS,
+    crew_agents=["screenwriter", "director", "producer", "writer", "script_consultant"],
+)
+
+
+# Writes the movie into movie_dir: builds its crew from template and runs it
+# with lib.crew_runner.
+#
+# With compact=True, each act and storyboard is also summarized in about
+# summary_words words, and later acts and storyboards build on those
+# summaries rather than on the full text of everything before them. With
+# context_tokens, no task is given more than that many tokens of upstream
+# output.
+def write_movie(
+    clients,
+    movie_dir,
+    movie_name,
+    movie_genre="Action",
+    storyboard_visual_style=ImageStylePresets.COMIC_BOOK.value,
+    movie_idea="A heist movie",
+    max_workers=1,
+    thread_initializer=None,
+    incremental=True,
+    num_acts=3,
+    compact=False,
+    summary_words=300,
+    context_tokens=None,
+    template=MOVIE_TEMPLATE,
+):
+
+    print("movie_dir", movie_dir)
+
+    # ensure that movie_dir exists
+    if not os.path.exists(movie_dir):
+        os.makedirs(movie_dir)
+
+    # write an initial idea into f"{movie_dir}/idea_original.md", leaving it
+    # untouched when it hasn't changed
+    idea_original = f"""# {movie_name}
+Genre: {movie_genre}
+
+## Plot
+{movie_idea}
+"""
+    idea_original_path = f"{movie_dir}/idea_original.md"
+    previous_idea = None
+    if os.path.exists(idea_original_path):
+        with open(idea_original_path) as f:
+            previous_idea = f.read()
+    if previous_idea != idea_original:
+        with open(idea_original_path, "w") as f:
+            f.write(idea_original)
+
+    with bus.span("setup", "crew"):
+        # agents read the movie's documents a section at a time, and each
+        # document is only read from disk again once it's been rewritten. They
+        # can also search them, and each output is indexed as it's written.
+        documents = DocumentStore(movie_dir)
+        search_index = SearchIndex(documents)
+        doc_tools = [
+            ListDocumentsTool(store=documents),
+            ReadSectionTool(store=documents),
+            SearchDocumentsTool(index=search_index),
+        ]
+
+        def structure_storyboard(outputs, act):
+            (storyboard,) = outputs
+            return parse_storyboard(storyboard, act).json(indent=2)
+
+        def structure_registry(outputs, act):
+            (registry,) = outputs
+            return parse_registry(registry).json(indent=2)
+
+        # The prompts are kept with their {char:...} and {loc:...} references,
+        # and only expanded from the registry when they're painted. So a prompt
+        # is still pinned when the registry changes, and its image is repainted
+        # with the new descriptions.
+        def illustrate_shots(outputs, act):
+            shot_list, storyboard, registry, *inputs = outputs
+            registry = Registry.parse_raw(registry)
+            shots = storyboard_shots(
+                shot_list,
+                Storyboard.parse_raw(storyboard),
+                f"{movie_dir}/{act}_act_images.json",
+                inputs=hashlib.sha256(
+                    "\0".join([storyboard_visual_style, *inputs]).encode()
+                ).hexdigest(),
+            )
+            shots = [Shot(shot.title, registry.expand(shot.prompt)) for shot in shots]
+            return illustrate(
+                clients.sd3,
+                shots,
+                movie_dir,
+                storyboard_visual_style,
+                derivatives=clients.derivatives,
+            )
+
+        params = {
+            "movie_name": movie_name,
+            "movie_genre": movie_genre,
+            "movie_idea": movie_idea,
+            "movie_dir": movie_dir,
+            "storyboard_visual_style": storyboard_visual_style,
+            "summary_words": summary_words,
+        }
+        acts = ACT_NAMES[:num_acts]
+        product_crew = template.crew(
+            clients.llms,
+            params,
+            acts,
+            doc_tools,
+            step_callback=agent_step_callback(clients.llm_events),
+            compact=compact,
+            stages={
+                "structure_storyboard": structure_storyboard,
+                "structure_registry": structure_registry,
+                "illustrate": illustrate_shots,
+            },
+        )
+        context_budgets = template.context_budgets(
+            params, acts, default=context_tokens, compact=compact
+        )
+        task_llms = template.task_llms(clients.llms, params, acts, compact=compact)
+
+    # tasks run in dependency order, side by side when max_workers > 1, and
+    # tasks whose inputs haven't changed since the last run are skipped
+    unsubscribe = bus.subscribe(search_index.on_event, run_id=current_run_id.get())
+    try:
+        crew_result = run_crew(
+            product_crew,
+            max_workers=max_workers,
+            initializer=thread_initializer,
+            manifest=Manifest(movie_dir),
+            incremental=incremental,
+            context_budgets=context_budgets,
+            task_llms=task_llms,
+        )
+    finally:
+        unsubscribe()
+    return crew_result
@@ -0,0 +1,234 @@
+import copy
+import os
+import time
+from typing import Callable
+from crewai import Crew, Process, Task
+from crewai.tasks.task_output import TaskOutput
+from pydantic import Field
+from lib.events import bus, task_context
+from lib.outputs import discard_partial, finalize_output
+from lib.scheduler import run_dag
+
+
+# A step in a crew's task graph that runs locally rather than through an
+# agent, e.g. painting a storyboard's images straight from its shot list. It's
+# a Task, so it can sit in a Crew and in other tasks' context. run_crew calls
+# run(outputs) with the outputs of the tasks in its context and saves what it
+# returns as its output. Its description is part of its fingerprint, so it
+# should mention anything else its output depends on.
+class Stage(Task):
+    run: Callable = Field(exclude=True)
+
+
+# Run a crew's tasks as a DAG derived from their context lists instead of one
+# after another. Each task runs as a single-task crew, so crewai still handles
+# delegation tools, prompts and writing the task's output_file.
+#
+# With a manifest, tasks whose inputs match the last run and whose output_file
+# is still there are skipped, and their output is loaded from disk instead.
+#
+# The crew emits a "crew" start event with the number of tasks, and every task
+# emits "task" start and end events on lib.events.bus. Each task runs with
+# lib.events.current_task set so LLM, tool and image events can be traced back
+# to it.
+#
+# context_budgets maps a task's output_file to the most tokens of upstream
+# output it should be given; longer context is trimmed to fit. task_llms maps
+# a task's output_file to the LLM it should run on instead of its agent's.
+def run_crew(
+    crew,
+    max_workers=4,
+    initializer=None,
+    manifest=None,
+    incremental=True,
+    context_budgets=None,
+    task_llms=None,
+):
+    tasks = list(crew.tasks)
+    bus.emit("crew", "start", "crew", tasks=len(tasks))
+
+    def run_task(task):
+        name = task_name(task)
+        agent = task.agent.role if task.agent else None
+        budget = (context_budgets or {}).get(task.output_file)
+        llm = (task_llms or {}).get(task.output_file)
+        with task_context(task):
+            bus.emit("task", "start", name, agent=agent)
+            start = time.perf_counter()
+            try:
+                fingerprint = (
+                    manifest.fingerprint(
+                        task,
+                        context_tokens=budget,
+                        model=getattr(llm, "model_name", None),
+                    )
+                    if manifest
+                    else None
+                )
+                skipped = bool(
+                    incremental and manifest and manifest.is_fresh(task, fingerprint)
+                )
+                if skipped:
+                    print(f"Skipping unchanged task, reusing {task.output_file}")
+                    task.output = load_task_output(task)
+                else:
+                    if isinstance(task, Stage):
+                        execute_stage(task)
+                    else:
+                        execute_task(crew, task, context_tokens=budget, llm=llm)
+                    if manifest:
+                        manifest.record(task, fingerprint)
+            except Exception as e:
+                duration = time.perf_counter() - start
+                bus.emit("task", "end", name, duration, agent=agent, error=str(e))
+                raise
+
+            bus.emit(
+                "task",
+                "end",
+                name,
+                time.perf_counter() - start,
+                agent=agent,
+                skipped=skipped,
+                bytes=len(task.output.raw_output.encode()) if task.output else 0,
+            )
+        return task.output
+
+    outputs = run_dag(
+        tasks,
+        lambda task: task.context or [],
+        run_task,
+        max_workers=max_workers,
+        initializer=initializer,
+    )
+
+    # like Process.sequential, the result of the crew is the last task's output
+    return outputs[-1].raw_output if outputs and outputs[-1] else ""
+
+
+def execute_task(crew, task, context_tokens=None, llm=None):
+    # Agents keep per-run state (their executor, the task they're on), so tasks
+    # that share an agent can't safely run it at the same time. Each task gets
+    # its own copies of the crew's agents, sharing their tool result cache.
+    # With llm, the task's agent runs on it instead of its own.
+    agents = {}
+    for agent in [*crew.agents, task.agent]:
+        if id(agent) not in agents:
+            agent_llm = llm if llm is not None and agent is task.agent else agent.llm
+            agent_copy = agent.model_copy(update={"llm": own_callbacks(agent_llm)})
+            # this also rebuilds the agent's executor around its llm
+            agent_copy.set_cache_handler(agent.cache_handler)
+            agents[id(agent)] = agent_copy
+
+    # the output_file is written here rather than by crewai, so that it's
+    # replaced atomically and a half-written file is never mistaken for output
+    update = {
+        "agent": agents[id(task.agent)],
+        "tools": list(task.tools or []),
+        "output_file": None,
+    }
+    if context_tokens and task.context:
+        update["context"] = fit_context(task.context, context_tokens)
+    task_copy = task.model_copy(update=update)
+
+    try:
+        Crew(
+            agents=list(agents.values()),
+            tasks=[task_copy],
+            verbose=crew.verbose,
+            process=Process.sequential,
+            step_callback=crew.step_callback,
+            max_rpm=crew.max_rpm,
+            language=crew.language,
+        ).kickoff()
+    except BaseException:
+        if task.output_file:
+            discard_partial(task.output_file)
+        raise
+
+    if task.output_file:
+        output = task_copy.output.exported_output
+        finalize_output(
+            task.output_file, output.json() if task.output_pydantic else str(output)
+        )
+
+    # downstream tasks read their context from the original task objects
+    task.output = task_copy.output
+
+
+def execute_stage(stage):
+    outputs = [
+        upstream.output.raw_output if upstream.output else ""
+        for upstream in stage.context or []
+    ]
+    content = stage.run(outputs)
+    if stage.output_file:
+        finalize_output(stage.output_file, content)
+    stage.output = TaskOutput(
+        description=stage.description, exported_output=content, raw_output=content
+    )
+
+
+# A shallow copy of llm, sharing its client, cache and concurrency limit, with
+# a list of callbacks of its own. crewai adds a token counter to an agent's
+# llm.callbacks whenever the agent is validated, which includes every time a
+# Crew is built with it, so agents are given one of these rather than a model
+# shared across tasks and runs, whose callbacks would keep growing.
+def own_callbacks(llm):
+    llm = copy.copy(llm)
+    # copies of pydantic v1 models, which langchain's are, share their __dict__
+    object.__setattr__(llm, "__dict__", dict(llm.__dict__))
+    if isinstance(llm.callbacks, list):
+        llm.callbacks = list(llm.callbacks)
+    return llm
+
+
+# about four characters a token for English prose, which is close enough for
+# budgeting and doesn't need a tokenizer
+CHARS_PER_TOKEN = 4
+
+
+# Stand-ins for the upstream tasks whose outputs together fit in max_tokens.
+# Outputs that are already short enough are kept whole, and the space left is
+# shared evenly between the longer ones, which are cut short.
+def fit_context(context, max_tokens):
+    outputs = [t.output.raw_output if t.output else "" for t in context]
+    remaining = max_tokens * CHARS_PER_TOKEN
+    if sum(len(output) for output in outputs) <= remaining:
+        return context
+
+    limits = [0] * len(outputs)
+    by_length = sorted(range(len(outputs)), key=lambda i: len(outputs[i]))
+    for n, i in enumerate(by_length):
+        limits[i] = min(len(outputs[i]), remaining // (len(outputs) - n))
+        remaining -= limits[i]
+
+    fitted = []
+    for upstream, output, limit in zip(context, outputs, limits):
+        if limit < len(output):
+            output = output[:limit] + "\n[...]"
+            upstream = upstream.model_copy(
+                update={
+                    "output": TaskOutput(
+                        description=upstream.description,
+                        exported_output=output,
+                        raw_output=output,
+                    )
+                }
+            )
+        fitted.append(upstream)
+    return fitted
+
+
+def load_task_output(task):
+    with open(task.output_file) as f:
+        content = f.read()
+    return TaskOutput(
+        description=task.description, exported_output=content, raw_output=content
+    )
+
+
+def task_name(task):
+    if task.output_file:
+        return os.path.basename(task.output_file)
+    return task.description[:40]
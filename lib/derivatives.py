@@ -0,0 +1,156 @@
+import hashlib
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+from lib.atomic import atomic_write
+
+DEFAULT_WIDTHS = (320, 640, 1280)
+DEFAULT_PREVIEW_WIDTH = 640
+DEFAULT_QUALITY = 80
+
+
+# Smaller WebP copies of generated images, at each of a few widths, so a
+# storyboard can be browsed without downloading every full-size image. They're
+# made in a pool of worker processes as soon as each image lands (see
+# on_image), and cached in directory by the image's content, so the same image
+# in any movie is only ever resized once.
+class Derivatives:
+    def __init__(
+        self,
+        directory,
+        widths=DEFAULT_WIDTHS,
+        preview_width=DEFAULT_PREVIEW_WIDTH,
+        quality=DEFAULT_QUALITY,
+        max_workers=None,
+    ):
+        self.widths = sorted(set(widths))
+        if not self.widths or self.widths[0] <= 0:
+            raise ValueError(f"Derivative widths must be positive, got {widths}")
+        if preview_width not in self.widths:
+            raise ValueError(f"Preview width {preview_width} isn't in {self.widths}")
+        self.directory = directory
+        self.preview_width = preview_width
+        self.quality = quality
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = None
+        # image path -> (its sha256, the future making its derivatives)
+        self._pending = {}
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    # an ImageGenerator callback, so resizing starts while the rest of the
+    # batch is still being painted. The image is already painted by then, so a
+    # failure here only costs its previews, and doesn't fail the image.
+    def on_image(self, prompt, path, duration, cached):
+        try:
+            self.submit(path)
+        except Exception as e:
+            print(f"Couldn't start making derivatives of {path}: {e}")
+
+    # Starts making the derivatives of the image at path, unless they're
+    # already cached or on their way.
+    def submit(self, path):
+        return self._submit(path)[1]
+
+    def _submit(self, path):
+        digest = file_sha256(path)
+        with self._lock:
+            pending = self._pending.get(path)
+            if pending is not None and pending[0] == digest and not failed(pending[1]):
+                return pending
+
+            missing = [
+                (width, self._cached_path(digest, width))
+                for width in self.widths
+                if not os.path.exists(self._cached_path(digest, width))
+            ]
+            if missing:
+                future = self._start(path, missing)
+            else:
+                future = Future()
+                future.set_result(None)
+            self._pending[path] = (digest, future)
+            return self._pending[path]
+
+    def _start(self, path, missing):
+        if self._executor is not None:
+            try:
+                return self._executor.submit(
+                    make_derivatives, path, missing, self.quality
+                )
+            except BrokenProcessPool:
+                # a worker died, e.g. killed for running out of memory, which
+                # breaks the whole pool for good, so start a new one
+                print("A derivative worker died, starting new ones")
+                self._executor.shutdown(wait=False)
+        # workers come from a fork server rather than forking this process,
+        # whose other threads may be holding locks
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+        return self._executor.submit(make_derivatives, path, missing, self.quality)
+
+    # Waits for the derivatives of the image at path, copies them next to it,
+    # and returns their paths by width. Raises if they couldn't be made.
+    def collect(self, path):
+        digest, future = self._submit(path)
+        try:
+            future.result()
+        finally:
+            with self._lock:
+                if self._pending.get(path, (None, None))[1] is future:
+                    del self._pending[path]
+
+        paths = {}
+        for width in self.widths:
+            target = derivative_path(path, width)
+            with open(self._cached_path(digest, width), "rb") as source:
+                with atomic_write(target, fsync=False) as f:
+                    shutil.copyfileobj(source, f)
+            paths[width] = target
+        return paths
+
+    def _cached_path(self, digest, width):
+        return os.path.join(self.directory, f"{digest}_{width}w_q{self.quality}.webp")
+
+
+def failed(future):
+    return future.done() and future.exception() is not None
+
+
+# e.g. image_<md5>_640w.webp for image_<md5>.jpg
+def derivative_path(path, width):
+    return f"{os.path.splitext(path)[0]}_{width}w.webp"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Runs in a worker process: writes source as a WebP at each (width, path) in
+# targets, never wider than source itself.
+def make_derivatives(source, targets, quality):
+    with Image.open(source) as image:
+        # a JPEG is decoded straight at the smallest scale that's still wide
+        # enough, which is much quicker than decoding it whole
+        largest = max(width for width, _ in targets)
+        image.draft("RGB", (largest, largest * image.height // image.width))
+        image = image.convert("RGB")
+
+    for width, path in sorted(targets, reverse=True):
+        width = min(width, image.width)
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        with atomic_write(path, fsync=False) as f:
+            resized.save(f, "WEBP", quality=quality)
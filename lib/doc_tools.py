@@ -0,0 +1,89 @@
+from typing import Any, Type
+from crewai_tools import BaseTool
+from pydantic import Field
+from pydantic.v1 import BaseModel as V1BaseModel, Field as V1Field
+
+# Tools that give agents the movie's documents through a DocumentStore (see
+# lib/documents.py), a section at a time, or search them with a SearchIndex
+# (see lib/search.py). Their results aren't cached by crewai, since the store
+# already keeps them and knows when a document has been rewritten.
+
+
+def never_cache(_args, _result):
+    return False
+
+
+class ListDocumentsTool(BaseTool):
+    name: str = "List the movie's documents"
+    description: str = (
+        "Lists the movie's documents, and the headings of the sections in each "
+        "one, so you can read just the section you need."
+    )
+    store: Any = Field(exclude=True)
+    cache_function: Any = never_cache
+
+    def _run(self, **kwargs):
+        return self.store.outline() or "There are no documents yet."
+
+
+class ReadSectionToolSchema(V1BaseModel):
+    document: str = V1Field(
+        ..., description="The document's file name, e.g. treatment.md"
+    )
+    section: str = V1Field(
+        "",
+        description="The heading of the section to read, e.g. Characters, or "
+        "nothing to read the whole document",
+    )
+
+
+class ReadSectionTool(BaseTool):
+    name: str = "Read a section of a document"
+    description: str = (
+        "Reads the section of one of the movie's documents under a heading, "
+        "e.g. the Characters section of treatment.md, or the whole document if "
+        "no section is given."
+    )
+    args_schema: Type[V1BaseModel] = ReadSectionToolSchema
+    store: Any = Field(exclude=True)
+    cache_function: Any = never_cache
+
+    def _run(self, document, section="", **kwargs):
+        try:
+            if not section.strip():
+                return self.store.document(document).text
+            return self.store.section(document, section).text
+        except FileNotFoundError:
+            return (
+                f"There's no document {document}, the documents are: "
+                + ", ".join(self.store.names())
+            )
+        except ValueError as e:
+            return str(e)
+
+
+class SearchDocumentsToolSchema(V1BaseModel):
+    query: str = V1Field(
+        ..., description="What to look for, e.g. Tiger's costume in the lookbook"
+    )
+
+
+class SearchDocumentsTool(BaseTool):
+    name: str = "Search the movie's documents"
+    description: str = (
+        "Finds the passages of the movie's documents and storyboards that best "
+        "match a query, with the document and section each one is from. Use it "
+        "to recall a detail without reading whole documents."
+    )
+    args_schema: Type[V1BaseModel] = SearchDocumentsToolSchema
+    index: Any = Field(exclude=True)
+    k: int = 5
+    cache_function: Any = never_cache
+
+    def _run(self, query, **kwargs):
+        passages = self.index.search(query, k=self.k)
+        if not passages:
+            return f"Nothing in the movie's documents matches {query!r}."
+        return "\n\n".join(
+            f"[{passage.location}]\n{passage.text}" for passage in passages
+        )
@@ -0,0 +1,141 @@
+import os
+import re
+import threading
+from collections import namedtuple
+
+HEADING = re.compile(r"^(?P<level>#{1,6})\s+(?P<title>.+?)\s*#*\s*$")
+FENCE = re.compile(r"^\s*(```|~~~)")
+
+# A section of a markdown document: its heading's title and level, and its
+# text, from the heading up to the next heading at the same level or above.
+Section = namedtuple("Section", ["title", "level", "text"])
+
+# A markdown document in a movie directory, by its file name, with its
+# sections in order.
+Document = namedtuple("Document", ["name", "text", "sections"])
+
+
+def parse_sections(text):
+    lines = text.splitlines(keepends=True)
+    headings = []
+    in_code = False
+    for i, line in enumerate(lines):
+        if FENCE.match(line):
+            in_code = not in_code
+            continue
+        heading = None if in_code else HEADING.match(line)
+        if heading:
+            headings.append((i, len(heading.group("level")), heading.group("title")))
+
+    sections = []
+    for n, (start, level, title) in enumerate(headings):
+        end = next(
+            (i for i, other, _ in headings[n + 1 :] if other <= level), len(lines)
+        )
+        sections.append(Section(title, level, "".join(lines[start:end]).strip()))
+    return sections
+
+
+# what a heading is matched on: its words, without case or markdown emphasis
+def normalize_title(title):
+    return " ".join(re.sub(r"[*_`#:]", " ", title).lower().split())
+
+
+# The markdown documents in a movie directory, parsed into sections and kept
+# in memory, so agents can read just the part of a document they need and
+# reading it again is free. A document is parsed again whenever its size or
+# modification time changes, e.g. when a task rewrites it.
+class DocumentStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # name -> (mtime_ns, size, Document)
+        self._documents = {}
+
+    # the file names of the documents, e.g. treatment.md
+    def names(self):
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return []
+        return sorted(
+            entry.name
+            for entry in entries
+            if entry.name.endswith(".md")
+            and not entry.name.startswith(".")
+            and entry.is_file()
+        )
+
+    # Raises FileNotFoundError if there's no such document.
+    def document(self, name):
+        name = self._name(name)
+        path = os.path.join(self.directory, name)
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._documents.get(name)
+            if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                self.hits += 1
+                return cached[2]
+            self.misses += 1
+
+        with open(path) as f:
+            text = f.read()
+        document = Document(name, text, parse_sections(text))
+        with self._lock:
+            self._documents[name] = (stat.st_mtime_ns, stat.st_size, document)
+        return document
+
+    # The section of a document under the heading title: the first whose
+    # heading is title, or else starts with it, or else contains it, ignoring
+    # case. Raises ValueError, listing the headings, if there's none.
+    def section(self, name, title):
+        document = self.document(name)
+        wanted = normalize_title(title)
+        headings = [normalize_title(section.title) for section in document.sections]
+        for matches in (
+            lambda heading: heading == wanted,
+            lambda heading: heading.startswith(wanted),
+            lambda heading: wanted in heading,
+        ):
+            for section, heading in zip(document.sections, headings):
+                if matches(heading):
+                    return section
+        raise ValueError(
+            f"{document.name} has no section {title!r}, its sections are: "
+            + ", ".join(repr(section.title) for section in document.sections)
+        )
+
+    # Every document's headings, indented by level, so an agent can see what
+    # there is to read.
+    def outline(self):
+        lines = []
+        for name in self.names():
+            try:
+                document = self.document(name)
+            except FileNotFoundError:
+                continue
+            lines.append(f"{name} ({len(document.text.split())} words)")
+            for section in document.sections:
+                lines.append(f"{'  ' * section.level}{section.title}")
+        return "\n".join(lines)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "documents": len(self._documents),
+            }
+
+    # Agents are told documents by their full path, so a path in the
+    # directory is accepted too. Anything outside it isn't.
+    def _name(self, name):
+        name = name.strip().strip("'\"")
+        if os.path.isabs(name) or os.path.dirname(name):
+            path = os.path.abspath(name)
+            if os.path.dirname(path) != os.path.abspath(self.directory):
+                raise FileNotFoundError(f"{name} isn't one of the movie's documents")
+            name = os.path.basename(path)
+        return name
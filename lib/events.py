@@ -0,0 +1,202 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+
+# Structured telemetry for a movie run. Everything interesting that happens -
+# tasks, agent steps, tool calls, delegations, LLM calls and image calls -
+# is emitted as an Event on the process-wide `bus`, and consumers such as the
+# UI, a log file or a metrics aggregator subscribe to it.
+#
+# kind is one of "setup", "crew", "task", "agent_step", "tool", "delegation",
+# "llm" or "image", phase is "start" or "end", and duration is only set on
+# "end" events. data holds anything else the event knows about: tokens, bytes,
+# output_file, etc.
+Event = namedtuple(
+    "Event", ["kind", "phase", "name", "time", "duration", "run_id", "data"]
+)
+
+# which run and task the current thread is working on, copied into worker
+# threads by lib.scheduler
+current_run_id = contextvars.ContextVar("current_run_id", default=None)
+current_task = contextvars.ContextVar("current_task", default=None)
+
+DELEGATION_TOOLS = ("Delegate work to co-worker", "Ask question to co-worker")
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, run_id=None):
+        # callback(event) is called for every event, or only for one run's
+        # events if run_id is given. Returns a function that unsubscribes.
+        subscriber = (callback, run_id)
+        with self._lock:
+            self._subscribers.append(subscriber)
+
+        def unsubscribe():
+            with self._lock:
+                if subscriber in self._subscribers:
+                    self._subscribers.remove(subscriber)
+
+        return unsubscribe
+
+    def emit(self, kind, phase, name, duration=None, **data):
+        task = current_task.get()
+        if task is not None and "output_file" not in data:
+            data["output_file"] = task.output_file
+        event = Event(
+            kind, phase, name, time.time(), duration, current_run_id.get(), data
+        )
+
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback, run_id in subscribers:
+            if run_id is None or run_id == event.run_id:
+                try:
+                    callback(event)
+                except Exception as e:
+                    # telemetry must never break a run
+                    print(f"Event subscriber failed: {e}")
+        return event
+
+    @contextmanager
+    def span(self, kind, name, **data):
+        # emits a start event, then an end event with the duration
+        self.emit(kind, "start", name, **data)
+        start = time.perf_counter()
+        try:
+            yield data
+        finally:
+            self.emit(kind, "end", name, time.perf_counter() - start, **data)
+
+
+bus = EventBus()
+
+
+@contextmanager
+def run_context(run_id):
+    token = current_run_id.set(run_id)
+    try:
+        yield
+    finally:
+        current_run_id.reset(token)
+
+
+@contextmanager
+def task_context(task):
+    token = current_task.set(task)
+    try:
+        yield
+    finally:
+        current_task.reset(token)
+
+
+# Pass as a Crew's step_callback to emit agent_step, tool and delegation
+# events. crewai calls it after every step with either the agent's final
+# answer or the (action, observation) pairs it just executed. Given the
+# lib.llm_events.LLMEventHandler on the agents' LLM, tool calls are timed from
+# the end of the completion that asked for them.
+def agent_step_callback(llm_handler=None, event_bus=bus):
+    def step_callback(step_output):
+        task = current_task.get()
+        agent = task.agent.role if task is not None and task.agent else "agent"
+        now = time.perf_counter()
+        started = llm_handler.last_end() if llm_handler else None
+
+        if isinstance(step_output, list):
+            for action, observation in step_output:
+                tool = getattr(action, "tool", "tool")
+                kind = "delegation" if tool in DELEGATION_TOOLS else "tool"
+                event_bus.emit(
+                    kind,
+                    "end",
+                    tool,
+                    now - started if started else None,
+                    agent=agent,
+                    input=str(getattr(action, "tool_input", ""))[:200],
+                    bytes=len(str(observation).encode()),
+                )
+            finished = False
+        else:
+            finished = True
+
+        event_bus.emit("agent_step", "end", agent, finished=finished)
+
+    return step_callback
+
+
+# Pass as an ImageGenerator callback to emit image events.
+def image_callback(event_bus=bus):
+    def on_image(prompt, path, duration, cached):
+        event_bus.emit(
+            "image",
+            "end",
+            os.path.basename(path),
+            duration,
+            cached=cached,
+            bytes=os.path.getsize(path) if os.path.exists(path) else 0,
+            prompt_chars=len(prompt),
+        )
+
+    return on_image
+
+
+# Writes every event to a JSON lines file.
+class EventLog:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event._asdict(), default=str)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+# Aggregates counts, durations, tokens and bytes per kind of event, and keeps
+# the finished tasks in order.
+class EventMetrics:
+    def __init__(self):
+        self.tasks = []
+        self._lock = threading.Lock()
+        self._totals = defaultdict(
+            lambda: {"count": 0, "duration": 0.0, "tokens": 0, "bytes": 0}
+        )
+        self._durations = defaultdict(list)
+
+    def __call__(self, event):
+        if event.phase != "end":
+            return
+        with self._lock:
+            totals = self._totals[event.kind]
+            totals["count"] += 1
+            totals["duration"] += event.duration or 0.0
+            totals["tokens"] += (event.data.get("prompt_tokens") or 0) + (
+                event.data.get("completion_tokens") or 0
+            )
+            totals["bytes"] += event.data.get("bytes") or 0
+            if event.duration is not None:
+                self._durations[event.kind].append(event.duration)
+            if event.kind == "task":
+                self.tasks.append(
+                    {
+                        "task": event.name,
+                        "duration": event.duration,
+                        "skipped": event.data.get("skipped", False),
+                    }
+                )
+
+    def totals(self):
+        with self._lock:
+            return {kind: dict(totals) for kind, totals in self._totals.items()}
+
+    def durations(self, kind):
+        with self._lock:
+            return list(self._durations[kind])
@@ -0,0 +1,360 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import requests
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# where recorded requests are forwarded to, by path prefix
+UPSTREAMS = {
+    "/v1/": "https://api.openai.com",
+    "/v2beta/": "https://api.stability.ai",
+}
+
+DEFAULT_IMAGE = os.path.join(os.path.dirname(__file__), "..", "test.jpg")
+
+
+# A local stand-in for the OpenAI and Stability APIs.
+#
+# In "record" mode every request is forwarded to the real API and the exchange
+# is saved to fixture_dir. In "replay" mode requests are answered from those
+# fixtures, after an artificial delay, without touching the network. Point the
+# pipeline at it with OPENAI_BASE_URL=<server.url>/v1 and
+# STABILITY_API_URL=<server.url>/v2beta/stable-image/generate/sd3.
+#
+# With synthesize=True, replay mode makes up a plausible response for requests
+# it has no fixture for, so the pipeline can be run end to end with no
+# recordings at all (see Synthesizer).
+class FixtureServer:
+    def __init__(
+        self,
+        fixture_dir,
+        mode="replay",
+        llm_latency=0.0,
+        image_latency=0.0,
+        synthesize=False,
+        synthesizer=None,
+        host="127.0.0.1",
+        port=0,
+    ):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown fixture mode: {mode}")
+
+        self.fixture_dir = fixture_dir
+        self.mode = mode
+        self.llm_latency = llm_latency
+        self.image_latency = image_latency
+        self.synthesizer = synthesizer or (Synthesizer() if synthesize else None)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if not os.path.exists(fixture_dir):
+            os.makedirs(fixture_dir)
+
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def openai_base_url(self):
+        return f"{self.url}/v1"
+
+    @property
+    def stability_url(self):
+        return f"{self.url}/v2beta/stable-image/generate/sd3"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def handle(self, path, headers, body):
+        key = request_key(path, headers.get("content-type", ""), body)
+
+        if self.mode == "record":
+            status, content_type, response_body = self._forward(path, headers, body)
+            if status == 200:
+                self._save(key, path, status, content_type, response_body)
+            return status, content_type, response_body
+
+        fixture = self._load(key)
+        with self._lock:
+            if fixture is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        time.sleep(self.image_latency if path.startswith("/v2beta/") else self.llm_latency)
+
+        if fixture is not None:
+            return fixture
+        if self.synthesizer is not None:
+            return self.synthesizer.respond(path, headers, body)
+        return (
+            404,
+            "application/json",
+            json.dumps({"error": f"No fixture recorded for {path} ({key})"}).encode(),
+        )
+
+    def _forward(self, path, headers, body):
+        upstream = next(
+            (url for prefix, url in UPSTREAMS.items() if path.startswith(prefix)), None
+        )
+        if upstream is None:
+            return 404, "application/json", b'{"error": "Unknown upstream"}'
+
+        response = requests.post(
+            f"{upstream}{path}",
+            data=body,
+            headers={
+                name: value
+                for name, value in headers.items()
+                if name.lower() in ("authorization", "content-type", "accept")
+            },
+            timeout=(10, 300),
+        )
+        return (
+            response.status_code,
+            response.headers.get("content-type", "application/octet-stream"),
+            response.content,
+        )
+
+    def _save(self, key, path, status, content_type, body):
+        with open(os.path.join(self.fixture_dir, f"{key}.body"), "wb") as f:
+            f.write(body)
+        with open(os.path.join(self.fixture_dir, f"{key}.json"), "w") as f:
+            json.dump(
+                {"path": path, "status": status, "content_type": content_type}, f
+            )
+
+    def _load(self, key):
+        try:
+            with open(os.path.join(self.fixture_dir, f"{key}.json")) as f:
+                meta = json.load(f)
+            with open(os.path.join(self.fixture_dir, f"{key}.body"), "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        return meta["status"], meta["content_type"], body
+
+
+# Identify a request by what it asks for rather than how it was encoded:
+# JSON bodies are re-serialized with sorted keys, and multipart form posts
+# (the Stability API) are reduced to their form fields, since the multipart
+# boundary changes on every request.
+def request_key(path, content_type, body):
+    if content_type.startswith("multipart/form-data"):
+        payload = form_fields(content_type, body)
+    elif content_type.startswith("application/json"):
+        payload = json.loads(body or b"null")
+    else:
+        payload = hashlib.sha256(body).hexdigest()
+
+    return hashlib.sha256(
+        json.dumps([path, payload], sort_keys=True).encode()
+    ).hexdigest()
+
+
+def form_fields(content_type, body):
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if name and name != "none":
+            fields[name] = part.get_payload(decode=True).decode("utf-8", "replace")
+    return fields
+
+
+# Makes up responses for requests there is no fixture for. Chat completions get
+# a ReAct-style answer that crewai agents accept: agents that have the
+# ImageGenerator tool call it `shots` times before answering, and every final
+# answer has one paragraph per shot. Image requests get the same JPEG back.
+class Synthesizer:
+    def __init__(self, shots=3, words_per_paragraph=60, image_path=DEFAULT_IMAGE):
+        self.shots = shots
+        self.words_per_paragraph = words_per_paragraph
+        with open(image_path, "rb") as f:
+            self.image = f.read()
+
+    def respond(self, path, headers, body):
+        if path.startswith("/v2beta/"):
+            return 200, "image/jpeg", self.image
+        if path.endswith("/chat/completions"):
+            request = json.loads(body)
+            model = request.get("model", "fixture")
+            content = self.completion(request["messages"])
+            if request.get("stream"):
+                return 200, "text/event-stream", chat_completion_stream(
+                    model, request, content
+                )
+            return 200, "application/json", json.dumps(
+                chat_completion(model, request, content)
+            ).encode()
+        return 404, "application/json", b'{"error": "Nothing to synthesize"}'
+
+    def completion(self, messages):
+        text = "\n".join(str(message.get("content", "")) for message in messages)
+        images_so_far = len(re.findall(r"Action: ImageGenerator", text))
+
+        if "ImageGenerator" in text and images_so_far < self.shots:
+            return (
+                "Thought: I need to generate the next storyboard image.\n"
+                "Action: ImageGenerator\n"
+                f'Action Input: {{"description": "{self.paragraph(images_so_far)}"}}'
+            )
+
+        paragraphs = "\n\n".join(
+            f"## Shot {i + 1}\n\n{self.paragraph(i)}" for i in range(self.shots)
+        )
+        return f"Thought: I now know the final answer\nFinal Answer: {paragraphs}"
+
+    def paragraph(self, i):
+        words = ["scene", "light", "character", "camera", "shadow", "street"]
+        return f"Shot {i + 1}: " + " ".join(
+            words[(i + j) % len(words)] for j in range(self.words_per_paragraph)
+        )
+
+
+# word counts standing in for token counts
+def completion_usage(request, content):
+    prompt_tokens = sum(
+        len(str(message.get("content", "")).split()) for message in request["messages"]
+    )
+    completion_tokens = len(content.split())
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def chat_completion(model, request, content):
+    return {
+        "id": f"chatcmpl-{hashlib.md5(content.encode()).hexdigest()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": completion_usage(request, content),
+    }
+
+
+# the server-sent events the API returns for "stream": true, a few words a
+# chunk, then the usage in a chunk of its own if the request asks for it
+def chat_completion_stream(model, request, content, words_per_chunk=5):
+    completion_id = f"chatcmpl-{hashlib.md5(content.encode()).hexdigest()}"
+    words = re.split(r"(?<=\s)", content)
+    pieces = [
+        "".join(words[i : i + words_per_chunk])
+        for i in range(0, len(words), words_per_chunk)
+    ]
+
+    def event(choices, **fields):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": choices,
+            **fields,
+        }
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    def delta(delta, finish_reason=None):
+        return event([{"index": 0, "delta": delta, "finish_reason": finish_reason}])
+
+    events = [delta({"role": "assistant", "content": ""})]
+    events += [delta({"content": piece}) for piece in pieces]
+    events.append(delta({}, "stop"))
+    if (request.get("stream_options") or {}).get("include_usage"):
+        events.append(event([], usage=completion_usage(request, content)))
+    events.append("data: [DONE]\n\n")
+    return "".join(events).encode()
+
+
+def _handler(fixture_server):
+    class FixtureHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("content-length", 0)))
+            status, content_type, response_body = fixture_server.handle(
+                self.path, self.headers, body
+            )
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(response_body)))
+            self.end_headers()
+            self.wfile.write(response_body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FixtureHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Record or replay OpenAI and Stability API exchanges locally."
+    )
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--dir", default="fixtures", help="fixture directory")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--image-latency", type=float, default=0.0)
+    parser.add_argument(
+        "--synthesize",
+        action="store_true",
+        help="make up responses for requests with no fixture",
+    )
+    parser.add_argument("--shots", type=int, default=3)
+    args = parser.parse_args()
+
+    server = FixtureServer(
+        args.dir,
+        mode=args.mode,
+        llm_latency=args.llm_latency,
+        image_latency=args.image_latency,
+        synthesizer=Synthesizer(shots=args.shots) if args.synthesize else None,
+        port=args.port,
+    )
+    print(f"{args.mode} server listening on {server.url}")
+    print(f"  OPENAI_BASE_URL={server.openai_base_url}")
+    print(f"  STABILITY_API_URL={server.stability_url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from lib.atomic import atomic_write
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2GB
+
+INDEX_FILE = "index.json"
+
+
+# A content-addressed image cache that sits in front of the Stability API.
+# Entries are keyed by everything that affects the generated image, so the same
+# shot description in any movie directory is only ever paid for once.
+class ImageCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # key -> {"file": ..., "size": ...}, least recently used first
+        self._entries = self._load_index()
+
+    # endpoint is the API the image comes from, when it isn't Stability's own
+    # (e.g. the fixture server), so its placeholder images are never served
+    # for a live run
+    @staticmethod
+    def key(
+        prompt, style_preset, aspect_ratio, output_format, seed=None, endpoint=None
+    ):
+        fields = [prompt, style_preset, aspect_ratio, output_format, seed]
+        if endpoint is not None:
+            fields.append(endpoint)
+        payload = json.dumps(fields, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @property
+    def total_bytes(self):
+        return sum(entry["size"] for entry in self._entries.values())
+
+    def get(self, key, path):
+        # copy the cached image to path, returning False on a miss
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                cached_path = os.path.join(self.directory, entry["file"])
+                if (
+                    not os.path.exists(cached_path)
+                    or os.path.getsize(cached_path) != entry["size"]
+                ):
+                    # someone removed or damaged the file behind our back
+                    del self._entries[key]
+                    self._save_index()
+                    entry = None
+
+            if entry is None:
+                self.misses += 1
+                return False
+
+            self._entries.move_to_end(key)
+            self._save_index()
+            self.hits += 1
+
+        if os.path.abspath(cached_path) != os.path.abspath(path):
+            with open(cached_path, "rb") as source, atomic_write(path) as f:
+                shutil.copyfileobj(source, f)
+        return True
+
+    def put(self, key, source_path, sha256=None):
+        extension = os.path.splitext(source_path)[1]
+        filename = f"{key}{extension}"
+        cached_path = os.path.join(self.directory, filename)
+
+        digest = hashlib.sha256()
+        with open(source_path, "rb") as source, atomic_write(cached_path) as f:
+            for chunk in iter(lambda: source.read(64 * 1024), b""):
+                f.write(chunk)
+                digest.update(chunk)
+            if sha256 is not None and digest.hexdigest() != sha256:
+                raise ValueError(f"Checksum mismatch caching {source_path}")
+
+        with self._lock:
+            self._entries[key] = {
+                "file": filename,
+                "size": os.path.getsize(cached_path),
+                "sha256": digest.hexdigest(),
+            }
+            self._entries.move_to_end(key)
+            self._evict()
+            self._save_index()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+            }
+
+    def _evict(self):
+        total = self.total_bytes
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            total -= entry["size"]
+            try:
+                os.remove(os.path.join(self.directory, entry["file"]))
+            except FileNotFoundError:
+                pass
+
+    def _load_index(self):
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        try:
+            with open(index_path) as f:
+                return OrderedDict(
+                    (key, entry) for key, entry in json.load(f)["entries"]
+                )
+        except (FileNotFoundError, ValueError, KeyError):
+            return OrderedDict()
+
+    def _save_index(self):
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        # the index is rewritten on every hit, so skip the fsync
+        with atomic_write(index_path, "w", fsync=False) as f:
+            json.dump({"entries": list(self._entries.items())}, f)
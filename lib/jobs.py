@@ -0,0 +1,185 @@
+import glob
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from lib.atomic import atomic_write
+from lib.events import EventLog, EventMetrics, bus, run_context
+from lib.log_sink import LogSink, capture_stdout
+
+ACTIVE = ("queued", "running")
+
+
+# A crew run submitted to a JobQueue. Everything but the log is saved to
+# <directory>/<id>.json whenever it changes, so the UI can poll it and a
+# restarted server still lists earlier jobs.
+class Job:
+    def __init__(self, id, name, key=None, params=None):
+        self.id = id
+        self.name = name
+        self.key = key
+        self.params = params or {}
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.tasks_total = None
+        self.tasks_done = 0
+        self.current_task = None
+        self.current_output = None
+        self.metrics = None
+        self.result = None
+        self.error = None
+        self.log = None
+
+    @property
+    def active(self):
+        return self.status in ACTIVE
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "key": self.key,
+            "params": self.params,
+            "status": self.status,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "tasks_total": self.tasks_total,
+            "tasks_done": self.tasks_done,
+            "current_task": self.current_task,
+            "current_output": self.current_output,
+            "metrics": self.metrics,
+            "result": self.result,
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data["id"], data["name"], data.get("key"), data.get("params"))
+        for name, value in data.items():
+            if name not in ("id", "name", "key", "params"):
+                setattr(job, name, value)
+        return job
+
+
+# Runs crews in the background on a bounded pool of worker threads, so a run
+# outlives the Streamlit script run that started it and at most max_workers
+# crews run at once on this host; the rest wait their turn.
+#
+# Each job runs in its own lib.events run context, with its console output
+# captured to log_path and its events written to events_path. Progress is
+# taken from the run's crew and task events.
+class JobQueue:
+    def __init__(self, directory, max_workers=2):
+        self.directory = directory
+        self.max_workers = max_workers
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="crew-job"
+        )
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            try:
+                with open(path) as f:
+                    job = Job.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError):
+                continue
+            if job.active:
+                # the process running it is gone
+                job.status = "interrupted"
+                self._save(job)
+            self._jobs[job.id] = job
+
+    def submit(self, name, fn, key=None, params=None, log_path=None, events_path=None):
+        # Queue fn(**params). Only one active job may have a given key, e.g.
+        # the movie slug, since two crews writing the same files would clash.
+        with self._lock:
+            if key is not None and any(
+                job.key == key and job.active for job in self._jobs.values()
+            ):
+                raise ValueError(f"A job for {key} is already queued or running")
+            job = Job(uuid.uuid4().hex, name, key, params)
+            self._jobs[job.id] = job
+        self._save(job)
+        self._executor.submit(self._run, job, fn, log_path, events_path)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        # newest first
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return sorted(jobs, key=lambda job: job.submitted, reverse=True)
+
+    def tail(self, job_id, n=50):
+        # the last n lines of the job's console output
+        job = self.get(job_id)
+        if job is None or job.log is None:
+            return []
+        return job.log.tail(n)
+
+    def _run(self, job, fn, log_path, events_path):
+        job.log = LogSink(None, log_path)
+        metrics = EventMetrics()
+
+        def progress(event):
+            with self._lock:
+                if event.kind == "crew" and event.phase == "start":
+                    job.tasks_total = event.data.get("tasks")
+                elif event.kind == "task" and event.phase == "start":
+                    job.current_task = event.name
+                    job.current_output = event.data.get("output_file")
+                elif event.kind == "task" and event.phase == "end":
+                    job.tasks_done += 1
+                else:
+                    return
+            self._save(job)
+
+        subscriptions = [
+            bus.subscribe(metrics, run_id=job.id),
+            bus.subscribe(progress, run_id=job.id),
+        ]
+        if events_path:
+            subscriptions.append(bus.subscribe(EventLog(events_path), run_id=job.id))
+
+        job.status = "running"
+        job.started = time.time()
+        self._save(job)
+        try:
+            with run_context(job.id), capture_stdout(job.log):
+                job.result = fn(**job.params)
+            job.status = "done"
+        except Exception as e:
+            job.status = "failed"
+            job.error = f"{e}\n\n{traceback.format_exc()}"
+        finally:
+            for unsubscribe in subscriptions:
+                unsubscribe()
+            job.log.close()
+            job.finished = time.time()
+            job.current_task = None
+            job.current_output = None
+            job.metrics = {"tasks": metrics.tasks, "totals": metrics.totals()}
+            self._save(job)
+
+    def _save(self, job):
+        # one save at a time, so an older snapshot never replaces a newer one
+        with self._save_lock:
+            with self._lock:
+                data = job.to_dict()
+            with atomic_write(
+                os.path.join(self.directory, f"{job.id}.json"), "w", fsync=False
+            ) as f:
+                json.dump(data, f, indent=2, default=str)
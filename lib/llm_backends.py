@@ -0,0 +1,97 @@
+import json
+import threading
+from collections import namedtuple
+from lib.llm_cache import CachedChatOpenAI
+
+# An OpenAI-compatible endpoint and model to run agents on. max_concurrency
+# caps the requests in flight to it across every run in the process, and
+# timeout is per request, in seconds. Leaving base_url and api_key unset uses
+# OPENAI_BASE_URL and OPENAI_API_KEY.
+Backend = namedtuple(
+    "Backend",
+    ["name", "model", "base_url", "api_key", "max_concurrency", "timeout"],
+    defaults=[None, None, None, None],
+)
+
+DEFAULT_BACKEND = Backend("default", "gpt-4-turbo")
+
+
+# Maps tasks and agents to LLM backends, e.g. from a JSON config:
+#
+#   {
+#     "backends": {
+#       "large": {"model": "gpt-4-turbo", "max_concurrency": 4, "timeout": 300},
+#       "small": {"model": "gpt-3.5-turbo", "max_concurrency": 16, "timeout": 60},
+#       "local": {"model": "llama2", "base_url": "http://localhost:11434/v1",
+#                 "api_key": "NA"}
+#     },
+#     "routes": {"storyboard_act": "small", "producer": "local"},
+#     "default": "large"
+#   }
+#
+# Routes are keyed by task name (see lib/crew.py) or agent name, and a task's
+# route wins over its agent's. Anything unrouted uses the default backend.
+# Each backend's model is built once and shared, so its concurrency limit
+# holds across runs. Runs happen on several threads at once, so building it is
+# done under a lock.
+class LLMRegistry:
+    def __init__(self, backends=None, routes=None, default=None, **llm_kwargs):
+        backends = list(backends or [DEFAULT_BACKEND])
+        self.backends = {backend.name: backend for backend in backends}
+        self.routes = dict(routes or {})
+        self.default = default or backends[0].name
+        self.llm_kwargs = llm_kwargs
+        self._llms = {}
+        self._lock = threading.Lock()
+
+        for name in [self.default, *self.routes.values()]:
+            if name not in self.backends:
+                raise ValueError(f"Unknown LLM backend {name}")
+
+    @classmethod
+    def from_config(cls, config, **llm_kwargs):
+        # config is a dict, or the path to a JSON file holding one
+        if isinstance(config, str):
+            with open(config) as f:
+                config = json.load(f)
+        return cls(
+            [
+                Backend(name, **options)
+                for name, options in config.get("backends", {}).items()
+            ]
+            or None,
+            routes=config.get("routes"),
+            default=config.get("default"),
+            **llm_kwargs,
+        )
+
+    def llm(self, backend_name):
+        with self._lock:
+            if backend_name not in self._llms:
+                backend = self.backends[backend_name]
+                # only pass what's configured, so the default backend's model
+                # (and so its cache keys) match a plain CachedChatOpenAI's
+                options = {
+                    "base_url": backend.base_url,
+                    "api_key": backend.api_key,
+                    "timeout": backend.timeout,
+                }
+                llm = CachedChatOpenAI(
+                    model=backend.model,
+                    **{k: v for k, v in options.items() if v is not None},
+                    **self.llm_kwargs,
+                )
+                if backend.max_concurrency:
+                    llm.limit_concurrency(backend.max_concurrency)
+                self._llms[backend_name] = llm
+            return self._llms[backend_name]
+
+    def backend_for(self, *names):
+        # the backend for the first of names that has a route
+        for name in names:
+            if name in self.routes:
+                return self.routes[name]
+        return self.default
+
+    def route(self, *names):
+        return self.llm(self.backend_for(*names))
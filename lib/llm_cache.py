@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import nullcontext
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_core.pydantic_v1 import PrivateAttr
+from langchain_openai import ChatOpenAI
+from langchain_openai.chat_models.base import _convert_delta_to_message_chunk
+
+DEFAULT_TTL = 7 * 24 * 60 * 60  # a week
+
+DEFAULT_MAX_ENTRIES = 10000
+
+
+# An on-disk cache of LLM completions for langchain models, e.g.
+# ChatOpenAI(model="gpt-4-turbo", cache=SQLiteCompletionCache("llm.sqlite")).
+# Entries are keyed by the model and its parameters (langchain's llm_string)
+# plus the full serialized message list, expire after ttl seconds, and the
+# least recently used entries are dropped beyond max_entries.
+class SQLiteCompletionCache(BaseCache):
+    def __init__(self, path, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode()).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        key = self.key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl and row[1] + self.ttl < now:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE completions SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+
+        generations = [loads(generation) for generation in json.loads(row[0])]
+        # a completion served from the cache used no tokens
+        for generation in generations:
+            if generation.generation_info:
+                generation.generation_info.pop("token_usage", None)
+        return generations
+
+    def update(self, prompt, llm_string, return_val):
+        key = self.key(prompt, llm_string)
+        value = json.dumps([dumps(generation) for generation in return_val])
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            if self.max_entries:
+                self._conn.execute(
+                    """DELETE FROM completions WHERE key IN (
+                        SELECT key FROM completions ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                    )""",
+                    (self.max_entries,),
+                )
+            self._conn.commit()
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            (entries,) = self._conn.execute(
+                "SELECT COUNT(*) FROM completions"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+# Agents call stream() rather than invoke(), and langchain only consults the
+# cache on invoke(). When a cache is set, stream() goes through invoke() with
+# stream=True instead: a hit comes back whole, and a miss is still streamed
+# through _stream, token callbacks and all, and then cached. The message
+# itself is only yielded once it's complete.
+#
+# limit_concurrency() caps how many requests this model (and its copies) has
+# in flight at once; cache hits don't count. It's kept out of the model's
+# fields so it doesn't change the cache key.
+#
+# A streamed completion only says how many tokens it used if asked to, in a
+# last chunk with no choices that ChatOpenAI would drop. _stream asks, and
+# passes the usage on in that chunk's generation_info as token_usage, where
+# lib.llm_events finds it.
+class CachedChatOpenAI(ChatOpenAI):
+    _limiter = PrivateAttr(default=None)
+
+    def limit_concurrency(self, max_concurrency):
+        self._limiter = threading.BoundedSemaphore(max_concurrency)
+        return self
+
+    def stream(self, input, config=None, *, stop=None, **kwargs):
+        if self.cache is None:
+            yield from super().stream(input, config=config, stop=stop, **kwargs)
+        else:
+            yield self.invoke(input, config=config, stop=stop, stream=True, **kwargs)
+
+    def _generate(self, *args, **kwargs):
+        with self._limited():
+            return super()._generate(*args, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        message_dicts, params = self._create_message_dicts(messages, stop)
+        params = {
+            **params,
+            **kwargs,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        chunk_class = AIMessageChunk
+        with self._limited():
+            with self.client.create(messages=message_dicts, **params) as response:
+                for chunk in response:
+                    if not isinstance(chunk, dict):
+                        chunk = chunk.model_dump()
+                    if not chunk["choices"]:
+                        if chunk.get("usage"):
+                            yield ChatGenerationChunk(
+                                message=chunk_class(content=""),
+                                generation_info={"token_usage": chunk["usage"]},
+                            )
+                        continue
+                    choice = chunk["choices"][0]
+                    if choice["delta"] is None:
+                        continue
+                    message = _convert_delta_to_message_chunk(
+                        choice["delta"], chunk_class
+                    )
+                    chunk_class = message.__class__
+                    generation_info = {}
+                    if choice.get("finish_reason"):
+                        generation_info["finish_reason"] = choice["finish_reason"]
+                    if choice.get("logprobs"):
+                        generation_info["logprobs"] = choice["logprobs"]
+                    generation = ChatGenerationChunk(
+                        message=message, generation_info=generation_info or None
+                    )
+                    if run_manager:
+                        run_manager.on_llm_new_token(
+                            generation.text,
+                            chunk=generation,
+                            logprobs=choice.get("logprobs"),
+                        )
+                    yield generation
+
+    # A completion from another endpoint, e.g. the fixture server (see
+    # lib/fixtures.py) or a local model, is a different completion. The
+    # default endpoint adds nothing, so its existing entries still match.
+    def _get_llm_string(self, stop=None, **kwargs):
+        # a streamed completion is the same completion
+        kwargs.pop("stream", None)
+        llm_string = super()._get_llm_string(stop=stop, **kwargs)
+        endpoint = self.openai_api_base or os.environ.get("OPENAI_BASE_URL")
+        return f"{llm_string}\0{endpoint}" if endpoint else llm_string
+
+    def _limited(self):
+        return self._limiter if self._limiter is not None else nullcontext()
@@ -0,0 +1,139 @@
+import threading
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from lib.events import bus, current_task
+from lib.outputs import partial_path, write_partial
+
+# where an agent's answer starts in a completion, see crewai's output parser
+FINAL_ANSWER = "Final Answer:"
+
+
+# Attach to an LLM with llm.callbacks = [LLMEventHandler()] to emit llm events
+# on lib.events.bus. It lives apart from lib/events.py so that following a
+# run's events doesn't mean importing langchain.
+#
+# It also remembers when each thread's last completion finished, which is when
+# the agent started on the tool call that agent_step_callback reports.
+class LLMEventHandler(BaseCallbackHandler):
+    def __init__(self, event_bus=bus):
+        self.bus = event_bus
+        self._starts = {}
+        self._last_end = threading.local()
+
+    def on_llm_start(self, serialized, prompts, run_id, **kwargs):
+        self._start(serialized, run_id, sum(len(p) for p in prompts))
+
+    def on_chat_model_start(self, serialized, messages, run_id, **kwargs):
+        self._start(
+            serialized,
+            run_id,
+            sum(len(str(m.content)) for batch in messages for m in batch),
+        )
+
+    def on_llm_end(self, response, run_id, **kwargs):
+        self._end(run_id, response=response)
+
+    def on_llm_error(self, error, run_id, **kwargs):
+        self._end(run_id, error=str(error))
+
+    def last_end(self):
+        return getattr(self._last_end, "time", None)
+
+    def _start(self, serialized, run_id, prompt_chars):
+        model = (serialized or {}).get("kwargs", {}).get("model_name", "llm")
+        self._starts[run_id] = (time.perf_counter(), model)
+        self.bus.emit("llm", "start", model, prompt_chars=prompt_chars)
+
+    def _end(self, run_id, response=None, error=None):
+        start, model = self._starts.pop(run_id, (None, "llm"))
+        now = time.perf_counter()
+        self._last_end.time = now
+        data = {"error": error} if error else token_usage(response)
+        self.bus.emit("llm", "end", model, now - start if start else None, **data)
+
+
+def token_usage(response):
+    generations = [g for gs in response.generations for g in gs]
+    usage = (response.llm_output or {}).get("token_usage")
+    if not usage:
+        # a streamed completion's usage comes with its last chunk, see
+        # lib.llm_cache.CachedChatOpenAI
+        usage = next(
+            (
+                g.generation_info["token_usage"]
+                for g in generations
+                if (g.generation_info or {}).get("token_usage")
+            ),
+            {},
+        )
+    text = "".join(g.text for g in generations)
+    return {
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+        "bytes": len(text.encode()),
+    }
+
+
+# Attach to an LLM with llm.callbacks = [OutputStreamer()] to stream the final
+# answer of the current task (see lib.events.current_task) into
+# <output_file>.partial as the tokens arrive, so it can be read long before the
+# task is done. The file is rewritten at most every flush_interval seconds,
+# always atomically, so readers never see half a write.
+#
+# Agents think out loud before they answer, so nothing is written until a
+# completion gets to "Final Answer:". A completion the LLM cache already had
+# arrives whole and is written when it ends; one it didn't is streamed. Answers given to a delegating
+# agent also show up in its task's file until that agent answers itself.
+#
+# lib.crew_runner replaces the partial file with the finished output_file, see
+# lib/outputs.py.
+class OutputStreamer(BaseCallbackHandler):
+    def __init__(self, flush_interval=0.5):
+        self.flush_interval = flush_interval
+        self._calls = {}
+
+    def on_llm_start(self, serialized, prompts, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_chat_model_start(self, serialized, messages, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_new_token(self, token, run_id, **kwargs):
+        call = self._calls.get(run_id)
+        if call is None:
+            return
+        call["tokens"].append(token)
+        now = time.monotonic()
+        if now - call["written"] >= self.flush_interval:
+            call["written"] = now
+            self._write(call)
+
+    def on_llm_end(self, response, run_id, **kwargs):
+        call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        if not call["tokens"]:
+            call["tokens"] = [g.text for gs in response.generations for g in gs]
+        self._write(call)
+
+    def on_llm_error(self, error, run_id, **kwargs):
+        self._calls.pop(run_id, None)
+
+    def _start(self, run_id):
+        task = current_task.get()
+        if task is not None and task.output_file:
+            self._calls[run_id] = {
+                "output_file": task.output_file,
+                "tokens": [],
+                "written": time.monotonic(),
+            }
+
+    def _write(self, call):
+        _, found, answer = "".join(call["tokens"]).partition(FINAL_ANSWER)
+        if not found:
+            return
+        try:
+            write_partial(call["output_file"], answer.lstrip())
+        except OSError as e:
+            # a preview must never break a run
+            print(f"Couldn't write {partial_path(call['output_file'])}: {e}")
@@ -0,0 +1,177 @@
+import contextvars
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+COLORS = ["red", "green", "blue", "orange"]
+
+CHAIN_START = "Entering new CrewAgentExecutor chain"
+
+HIGHLIGHTS = [
+    CHAIN_START,
+    "Producer",
+    "Director",
+    "Screenwriter",
+    "Script Consultant",
+    "Cinematographer",
+    "Writer",
+    "Finished chain.",
+]
+
+# the sink print() output from this thread should go to, see capture_stdout
+current_sink = contextvars.ContextVar("current_sink", default=None)
+
+
+# A file-like sink for the crew's console output, e.g.
+# with capture_stdout(LogSink(st.empty(), "run.log")): ...
+#
+# Each write strips ANSI codes and colors agent names in a single regex pass,
+# then lands in a bounded buffer of recent lines. The placeholder is redrawn
+# with those lines at most every flush_interval seconds (or sooner once
+# flush_bytes of new output are waiting), so the page holds one element and
+# each redraw costs the same however long the run has been going. Everything
+# written also goes to path, if given. Without a placeholder nothing is
+# rendered, and tail() returns the recent lines instead.
+class LogSink:
+    def __init__(
+        self,
+        placeholder=None,
+        path=None,
+        max_lines=200,
+        flush_interval=0.5,
+        flush_bytes=16384,
+        highlights=HIGHLIGHTS,
+    ):
+        self.placeholder = placeholder
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.lines = deque(maxlen=max_lines)
+        self._partial = ""
+        self._pending = 0
+        self._last_render = 0.0
+        self._color_index = 0
+        self._lock = threading.Lock()
+        self._pattern = re.compile(
+            r"(?P<ansi>\x1B\[[0-9;]*[mK])|(?P<word>"
+            + "|".join(re.escape(word) for word in highlights)
+            + ")"
+        )
+
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, data):
+        with self._lock:
+            if self._file is not None:
+                self._file.write(data)
+
+            text = self._partial + self._pattern.sub(self._highlight, data)
+            *complete, self._partial = text.split("\n")
+            self.lines.extend(complete)
+            self._pending += len(data)
+
+            now = time.monotonic()
+            if (
+                self._pending >= self.flush_bytes
+                or now - self._last_render >= self.flush_interval
+            ):
+                self._render(now)
+        return len(data)
+
+    def flush(self):
+        # print(..., flush=True) calls this on every line, so it only flushes
+        # the log file and leaves the redraw to the throttle
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        # draw whatever is still waiting and close the log file
+        with self._lock:
+            if self._partial:
+                self.lines.append(self._partial)
+                self._partial = ""
+            self._render(time.monotonic())
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def tail(self, n=None):
+        with self._lock:
+            lines = list(self.lines)
+        return lines[-n:] if n else lines
+
+    def _highlight(self, match):
+        if match.group("ansi"):
+            return ""
+        word = match.group("word")
+        if word == CHAIN_START:
+            self._color_index = (self._color_index + 1) % len(COLORS)
+        return f":{COLORS[self._color_index]}[{word}]"
+
+    def _render(self, now):
+        self._pending = 0
+        self._last_render = now
+        if self._file is not None:
+            self._file.flush()
+        if self.placeholder is not None:
+            # trailing double spaces keep markdown from joining the lines
+            self.placeholder.markdown("  \n".join(self.lines), unsafe_allow_html=True)
+
+
+# Stands in for sys.stdout while any run is capturing output, and hands each
+# write to the current context's sink, or to the real stdout when there is
+# none. Worker threads started through lib.scheduler inherit the context, so
+# a run's tasks all log to that run's sink.
+class StdoutRouter:
+    def __init__(self, default):
+        self.default = default
+
+    def _target(self):
+        sink = current_sink.get()
+        return self.default if sink is None else sink
+
+    def write(self, data):
+        return self._target().write(data)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.default, name)
+
+
+_router = None
+_router_users = 0
+_router_lock = threading.Lock()
+
+
+# Send everything printed in this context (and the worker threads it starts)
+# to sink, while other Streamlit sessions keep their own. sys.stdout is put
+# back once the last capture ends.
+@contextmanager
+def capture_stdout(sink):
+    global _router, _router_users
+    with _router_lock:
+        if _router_users == 0:
+            _router = StdoutRouter(sys.stdout)
+            sys.stdout = _router
+        _router_users += 1
+
+    token = current_sink.set(sink)
+    try:
+        yield sink
+    finally:
+        current_sink.reset(token)
+        with _router_lock:
+            _router_users -= 1
+            if _router_users == 0:
+                if sys.stdout is _router:
+                    sys.stdout = _router.default
+                _router = None
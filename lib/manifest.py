@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import threading
+from lib.atomic import atomic_write
+
+MANIFEST_FILE = ".manifest.json"
+
+
+# Records what each task's output_file in a movie directory was built from, so
+# a rerun can skip tasks whose inputs haven't changed. A task's fingerprint
+# covers its prompt, its agent, the model and the outputs of the tasks in its
+# context, so a change anywhere upstream makes every descendant stale.
+class Manifest:
+    def __init__(self, movie_dir):
+        self.path = os.path.join(movie_dir, MANIFEST_FILE)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self._entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._entries = {}
+
+    def fingerprint(self, task, **extra):
+        # extra holds anything else the output depends on, e.g. a context budget
+        agent = task.agent
+        parts = {
+            "description": task.description,
+            "expected_output": task.expected_output,
+            "context": [self._output_hash(upstream) for upstream in task.context or []],
+        }
+        # stages (see lib.crew_runner.Stage) run without an agent
+        if agent is not None:
+            llm = getattr(agent, "llm", None)
+            parts["agent"] = [agent.role, agent.goal, agent.backstory]
+            parts["model"] = getattr(llm, "model_name", None) or type(llm).__name__
+            parts["tools"] = [tool.name for tool in (task.tools or agent.tools or [])]
+        extra = {name: value for name, value in extra.items() if value is not None}
+        if extra:
+            parts["extra"] = extra
+        return hashlib.sha256(
+            json.dumps(parts, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def is_fresh(self, task, fingerprint):
+        if not task.output_file or not os.path.exists(task.output_file):
+            return False
+        with self._lock:
+            entry = self._entries.get(self._key(task))
+        return entry is not None and entry["fingerprint"] == fingerprint
+
+    def record(self, task, fingerprint):
+        if not task.output_file:
+            return
+        with self._lock:
+            self._entries[self._key(task)] = {"fingerprint": fingerprint}
+            with atomic_write(self.path, "w") as f:
+                json.dump(self._entries, f, indent=2, sort_keys=True)
+
+    def _key(self, task):
+        return os.path.basename(task.output_file)
+
+    def _output_hash(self, task):
+        # hash what's on disk when we can, so a skipped task and a freshly run
+        # one produce the same fingerprint for their descendants
+        if task.output_file and os.path.exists(task.output_file):
+            with open(task.output_file, "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        if task.output is not None:
+            return hashlib.sha256(task.output.raw_output.encode()).hexdigest()
+        return None
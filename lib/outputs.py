@@ -0,0 +1,44 @@
+import os
+from lib.atomic import atomic_write
+
+PARTIAL_SUFFIX = ".partial"
+
+
+# the in-progress copy of output_file, while its task is running, see
+# OutputStreamer in lib/llm_events.py
+def partial_path(output_file):
+    return output_file + PARTIAL_SUFFIX
+
+
+# Replace the partial copy of output_file with what's been written so far. It's
+# rewritten often and thrown away at the end, so it isn't fsynced.
+def write_partial(output_file, content):
+    with atomic_write(partial_path(output_file), "w", fsync=False) as f:
+        f.write(content)
+
+
+# Replace output_file with its finished content, atomically, and drop the
+# partial copy.
+def finalize_output(output_file, content):
+    with atomic_write(output_file, "w") as f:
+        f.write(content)
+    discard_partial(output_file)
+
+
+def discard_partial(output_file):
+    try:
+        os.remove(partial_path(output_file))
+    except FileNotFoundError:
+        pass
+
+
+# What's been written of output_file so far: the finished file, or the partial
+# one while its task is still running. None when there's neither.
+def read_output(output_file):
+    for path in (partial_path(output_file), output_file):
+        try:
+            with open(path) as f:
+                return f.read()
+        except FileNotFoundError:
+            continue
+    return None
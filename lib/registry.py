@@ -0,0 +1,79 @@
+import re
+from typing import Dict
+from pydantic.v1 import BaseModel, Field
+
+# a short reference to a registry entry in an image prompt, e.g. {char:tiger}
+REFERENCE = re.compile(r"\{(?P<kind>char|loc):\s*(?P<key>[^{}]+?)\s*\}")
+
+SECTION = re.compile(r"^#{1,6}\s+(?P<title>.*)")
+# "key: description", as a bullet or numbered item and in bold or not. The key
+# is anything before the first colon, e.g. "Little Bean (Lola)".
+ENTRY = re.compile(
+    r"^[\s*_-]*(?:\d+[.)]\s+)?(?P<key>[^:]+?)[\s*_]*:[\s*_]*(?P<value>.+?)\s*$"
+)
+
+SECTIONS = ("characters", "locations", "style")
+
+
+# The canonical description of every recurring character and location in a
+# movie, and of its visual style, so every image prompt describes them in
+# exactly the same words.
+class Registry(BaseModel):
+    characters: Dict[str, str] = Field(default_factory=dict)
+    locations: Dict[str, str] = Field(default_factory=dict)
+    style: str = ""
+
+    # Replaces the references in prompt with their descriptions, and adds the
+    # style. A reference to something that isn't registered becomes its name.
+    def expand(self, prompt):
+        def description(match):
+            kind, name = match.group("kind"), match.group("key")
+            entries = self.characters if kind == "char" else self.locations
+            return entries.get(registry_key(name), name.replace("_", " "))
+
+        expanded = REFERENCE.sub(description, prompt)
+        if not self.style:
+            return expanded
+        return f"{expanded.rstrip().rstrip('.')}. {self.style}"
+
+
+# How write_registry is asked to lay the registry out, so parse_registry can
+# read it back.
+REGISTRY_FORMAT = """## Characters
+<key>: <full name, and everything about how they look>
+
+## Locations
+<key>: <everything about how the place looks>
+
+## Style
+<the visual style, color palette and tone of every image>"""
+
+
+# e.g. little_bean_lola for "Little Bean (Lola)"
+def registry_key(name):
+    return re.sub(r"\W+", "_", name.lower()).strip("_")
+
+
+# Reads a registry written in REGISTRY_FORMAT. Lines that aren't "key:
+# description" entries are ignored, except under Style, which is kept whole.
+def parse_registry(text):
+    sections = {"characters": {}, "locations": {}, "style": []}
+    section = None
+    for line in text.splitlines():
+        heading = SECTION.match(line)
+        if heading:
+            title = heading.group("title").strip().lower()
+            section = next((name for name in SECTIONS if name in title), None)
+        elif section == "style":
+            if line.strip():
+                sections["style"].append(line.strip())
+        elif section is not None:
+            entry = ENTRY.match(line)
+            if entry:
+                key = registry_key(entry.group("key"))
+                sections[section][key] = entry.group("value")
+    return Registry(
+        characters=sections["characters"],
+        locations=sections["locations"],
+        style=" ".join(sections["style"]),
+    )
@@ -0,0 +1,96 @@
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class CycleError(Exception):
+    pass
+
+
+# Work out, for each node, the indexes of the nodes it depends on. Dependencies
+# that aren't in the list of nodes are treated as already satisfied.
+def dependency_indexes(nodes, dependencies):
+    index = {id(node): i for i, node in enumerate(nodes)}
+    return [
+        sorted({index[id(dep)] for dep in dependencies(node) if id(dep) in index})
+        for node in nodes
+    ]
+
+
+def check_acyclic(nodes, deps):
+    remaining = [len(d) for d in deps]
+    dependents = [[] for _ in nodes]
+    for i, node_deps in enumerate(deps):
+        for dep in node_deps:
+            dependents[dep].append(i)
+
+    ready = [i for i, count in enumerate(remaining) if count == 0]
+    visited = 0
+    while ready:
+        i = ready.pop()
+        visited += 1
+        for j in dependents[i]:
+            remaining[j] -= 1
+            if remaining[j] == 0:
+                ready.append(j)
+
+    if visited != len(nodes):
+        stuck = [nodes[i] for i, count in enumerate(remaining) if count > 0]
+        raise CycleError(f"Dependency cycle between {len(stuck)} nodes: {stuck}")
+    return dependents
+
+
+# Run each node as soon as everything it depends on has finished, with at most
+# max_workers running at once. Ready nodes are started in list order, and
+# results come back in list order. If a node fails, nothing new is started,
+# the nodes already running are allowed to finish, and the error is raised.
+def run_dag(nodes, dependencies, run, max_workers=4, initializer=None):
+    nodes = list(nodes)
+    deps = dependency_indexes(nodes, dependencies)
+    dependents = check_acyclic(nodes, deps)
+
+    results = [None] * len(nodes)
+    remaining = [len(d) for d in deps]
+    error = None
+    workers = max(1, max_workers)
+
+    with ThreadPoolExecutor(max_workers=workers, initializer=initializer) as executor:
+        pending = {}
+        # nodes whose dependencies have finished, waiting for a worker. They're
+        # only handed to the executor when one is free, so after a failure
+        # they can simply be dropped.
+        ready = [i for i, count in enumerate(remaining) if count == 0]
+
+        def submit_ready():
+            ready.sort(reverse=True)
+            while ready and len(pending) < workers:
+                i = ready.pop()
+                # each node runs in a copy of the caller's context, so context
+                # variables set by the caller are visible inside the worker
+                context = contextvars.copy_context()
+                pending[executor.submit(context.run, run, nodes[i])] = i
+
+        submit_ready()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=lambda f: pending[f]):
+                i = pending.pop(future)
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    if error is None:
+                        error = e
+                        ready.clear()
+                    continue
+
+                if error is not None:
+                    continue
+                for j in dependents[i]:
+                    remaining[j] -= 1
+                    if remaining[j] == 0:
+                        ready.append(j)
+            if error is None:
+                submit_ready()
+
+    if error is not None:
+        raise error
+    return results
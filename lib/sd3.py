@@ -1,5 +1,15 @@
+import contextvars
+import hashlib
+import random
+import threading
+import time
 import requests
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
 from enum import Enum
+from requests.adapters import HTTPAdapter
+from lib.atomic import atomic_write
 
 class ImageStylePresets(Enum):
 	THREE_D_MODEL = "3d-model"
@@ -21,35 +31,302 @@ class ImageStylePresets(Enum):
 	TILE_TEXTURE = "tile-texture"
 
 
+SD3_URL = "https://api.stability.ai/v2beta/stable-image/generate/sd3"
+
+# images are streamed to disk in chunks of this size rather than held in memory
+CHUNK_SIZE = 64 * 1024
+
+# responses worth another attempt: rate limiting and transient server trouble
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class TruncatedImage(Exception):
+    pass
+
+
+# errors partway through downloading an image, worth another attempt
+DOWNLOAD_ERRORS = (
+    requests.exceptions.ChunkedEncodingError,
+    requests.ConnectionError,
+    requests.Timeout,
+    TruncatedImage,
+)
+
+# the outcome of one job passed to ImageGenerator.run_many; error is None on success
+ImageJobResult = namedtuple("ImageJobResult", ["prompt", "path", "error"])
+
+
+# An HTTPAdapter that counts the connections it opens. urllib3 reconnects a
+# connection the server closed through the same connection object, which its
+# pools don't count as new, so the count is taken where sockets are opened.
+class CountingAdapter(HTTPAdapter):
+    def __init__(self, *args, **kwargs):
+        self.connections_opened = 0
+        self._count_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: self._counting_pool(pool_cls)
+            for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def _counting_pool(self, pool_cls):
+        adapter = self
+
+        class CountingConnection(pool_cls.ConnectionCls):
+            def connect(self):
+                super().connect()
+                with adapter._count_lock:
+                    adapter.connections_opened += 1
+
+        return type(
+            pool_cls.__name__, (pool_cls,), {"ConnectionCls": CountingConnection}
+        )
+
+
 class ImageGenerator:
-    def __init__(self, api_key):
+    def __init__(
+        self,
+        api_key,
+        cache=None,
+        max_workers=4,
+        max_retries=4,
+        backoff_base=1.0,
+        backoff_max=30.0,
+        connect_timeout=10.0,
+        read_timeout=120.0,
+        url=SD3_URL,
+        callbacks=None,
+    ):
         self.api_key = api_key
+        self.url = url
+        # called as callback(prompt, path, duration, cached) after each image
+        self.callbacks = list(callbacks or [])
+        self.cache = cache
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = (connect_timeout, read_timeout)
 
-    def run(self, prompt, path, style_preset=ImageStylePresets.COMIC_BOOK.value):
-        print(
-            f"Generating image for prompt: {prompt} with api key {self.api_key} and path {path}"
-        )
-        response = requests.post(
-            f"https://api.stability.ai/v2beta/stable-image/generate/sd3",
-            headers={"authorization": f"Bearer {self.api_key}", "accept": "image/*"},
-            files={"none": ""},
-            data={
-                "prompt": prompt,
-                "output_format": "jpeg",
-                "aspect_ratio": "16:9",
-                "style_preset": style_preset,
-                # "negative_prompt": "a dark and stormy night",
-                # "seed": 123456, # for consistency
-            },
+        # one keep-alive session, with a connection per concurrent worker
+        self._adapter = CountingAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session = requests.Session()
+        self.session.headers.update(
+            {"authorization": f"Bearer {api_key}", "accept": "image/*"}
         )
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._retries = 0
+
+    def run(
+        self,
+        prompt,
+        path,
+        style_preset=ImageStylePresets.COMIC_BOOK.value,
+        aspect_ratio="16:9",
+        output_format="jpeg",
+        seed=None,
+        timeout=None,
+    ):
+        start = time.perf_counter()
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(
+                prompt,
+                style_preset,
+                aspect_ratio,
+                output_format,
+                seed,
+                endpoint=self.url if self.url != SD3_URL else None,
+            )
+            if self.cache.get(cache_key, path):
+                print(f"Using cached image for prompt: {prompt} at path {path}")
+                self._notify(prompt, path, start, cached=True)
+                return
+
+        print(f"Generating image for prompt: {prompt} at path {path}")
+        data = {
+            "prompt": prompt,
+            "output_format": output_format,
+            "aspect_ratio": aspect_ratio,
+            "style_preset": style_preset,
+            # "negative_prompt": "a dark and stormy night",
+        }
+        if seed is not None:
+            data["seed"] = seed  # for consistency
+
+        # every request this generator makes, from any thread or batch, shares
+        # max_workers slots, and so the connection pool
+        with self._slots:
+            sha256 = self._fetch(data, timeout or self.timeout, path)
+
+        if cache_key is not None:
+            self.cache.put(cache_key, path, sha256=sha256)
+        self._notify(prompt, path, start, cached=False)
+
+    def _notify(self, prompt, path, start, cached):
+        duration = time.perf_counter() - start
+        for callback in self.callbacks:
+            callback(prompt, path, duration, cached)
+
+    def _fetch(self, data, timeout, path):
+        # a response cut off partway through the image is retried like a
+        # failed request
+        attempt = 0
+        while True:
+            with self._post(data, timeout) as response:
+                if response.status_code != 200:
+                    try:
+                        raise Exception(str(response.json()))
+                    except ValueError:
+                        raise Exception(f"{response.status_code}: {response.text}")
+                try:
+                    return self._download(response, path)
+                except DOWNLOAD_ERRORS as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    error = e
+
+            attempt += 1
+            with self._stats_lock:
+                self._retries += 1
+            delay = self._backoff(attempt - 1)
+            print(
+                f"Retrying image download in {delay:.1f}s (attempt {attempt}): {error}"
+            )
+            time.sleep(delay)
+
+    def _download(self, response, path):
+        # the image only appears at path once every byte has arrived and hit the disk
+        sha256 = hashlib.sha256()
+        size = 0
+        with atomic_write(path) as file:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                file.write(chunk)
+                sha256.update(chunk)
+                size += len(chunk)
+
+            expected_size = response.headers.get("content-length")
+            if (
+                expected_size is not None
+                and "content-encoding" not in response.headers
+                and int(expected_size) != size
+            ):
+                raise TruncatedImage(
+                    f"Truncated image for {path}: got {size} of {expected_size} bytes"
+                )
+            if size == 0:
+                raise Exception(f"Empty image returned for {path}")
+
+        return sha256.hexdigest()
+
+    def stats(self):
+        with self._stats_lock:
+            requests_sent = self._requests
+            retries = self._retries
+        connections = self._adapter.connections_opened
+        return {
+            "requests": requests_sent,
+            "retries": retries,
+            "connections": connections,
+            "reused_connections": max(requests_sent - connections, 0),
+        }
+
+    def _post(self, data, timeout):
+        attempt = 0
+        while True:
+            with self._stats_lock:
+                self._requests += 1
+            try:
+                response = self.session.post(
+                    self.url,
+                    files={"none": ""},
+                    data=data,
+                    timeout=timeout,
+                    stream=True,
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if (
+                    response.status_code not in RETRY_STATUS_CODES
+                    or attempt >= self.max_retries
+                ):
+                    return response
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                response.close()
+
+            attempt += 1
+            with self._stats_lock:
+                self._retries += 1
+            print(f"Retrying image generation in {delay:.1f}s (attempt {attempt})")
+            time.sleep(delay)
+
+    def _backoff(self, attempt):
+        # exponential backoff with full jitter, so parallel workers spread out
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def _retry_after(self, response):
+        retry_after = response.headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        return max(retry_at.timestamp() - time.time(), 0.0)
+
+    def run_many(self, jobs, max_workers=None):
+        # jobs are (prompt, path, options) tuples, where options are keyword
+        # arguments for run(). Results come back in the same order as the jobs,
+        # and a failed job is reported in its result rather than raised.
+        jobs = list(jobs)
+        if not jobs:
+            return []
+
+        def run_job(job):
+            prompt, path, options = job
+            try:
+                self.run(prompt, path, **(options or {}))
+                return ImageJobResult(prompt, path, None)
+            except Exception as e:
+                return ImageJobResult(prompt, path, e)
 
-        if response.status_code == 200:
-            with open(path, "wb") as file:
-                file.write(response.content)
-        else:
-            raise Exception(str(response.json()))
+        # each job runs in a copy of the caller's context, so callbacks can
+        # tell which run and task its image belongs to. Batches running side
+        # by side, e.g. for several acts, still share max_workers requests.
+        workers = min(max_workers or self.max_workers, len(jobs))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, run_job, job)
+                for job in jobs
+            ]
+            return [future.result() for future in futures]
 
 
 # Usage:
-# generator = ImageGenerator("sk-MYAPIKEY")
-# generator.run()
+# generator = ImageGenerator("sk-MYAPIKEY", cache=ImageCache("/tmp/image_cache"))
+# generator.run("a cinematic photograph of a dog wearing black glasses", "dog.jpg")
+# print(generator.stats())
+# results = generator.run_many(
+#     [
+#         ("a dog wearing black glasses", "dog.jpg", {}),
+#         ("a cat in a top hat", "cat.jpg", {"style_preset": "anime", "seed": 42}),
+#     ],
+#     max_workers=2,
+# )
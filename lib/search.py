@@ -0,0 +1,185 @@
+import heapq
+import math
+import os
+import re
+import threading
+from collections import Counter, namedtuple
+from lib.documents import HEADING
+
+# a passage grows paragraph by paragraph up to about this many words
+PASSAGE_WORDS = 120
+
+# BM25's term frequency saturation and document length normalization
+K1 = 1.5
+B = 0.75
+
+WORD = re.compile(r"[a-z0-9]+")
+STOPWORDS = set(
+    """a an and are as at be but by for from has have he her his in is it its of
+    on or she that the their them they this to was were will with""".split()
+)
+
+# A passage of a document: where it is, by file name and the headings it's
+# under, e.g. "treatment.md > Characters > Tiger", and its text.
+Passage = namedtuple("Passage", ["document", "location", "text"])
+
+
+# lowercased words, without stopwords and with plurals folded, so "Costumes"
+# finds "costume"
+def tokenize(text):
+    terms = []
+    for word in WORD.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+# A document's passages: the text under each heading, cut at paragraph breaks
+# into pieces of about PASSAGE_WORDS words.
+def split_passages(document):
+    passages = []
+    headings = []
+    paragraphs = []
+    words = 0
+
+    def flush():
+        nonlocal paragraphs, words
+        text = "\n\n".join(paragraphs).strip()
+        if text:
+            location = " > ".join([document.name] + [title for _, title in headings])
+            passages.append(Passage(document.name, location, text))
+        paragraphs, words = [], 0
+
+    for block in re.split(r"\n\s*\n", document.text):
+        lines = []
+        for line in block.strip().splitlines():
+            heading = HEADING.match(line)
+            if heading is None:
+                lines.append(line)
+                continue
+            # a new heading ends the passage, and sets where the next one is
+            if lines:
+                paragraphs.append("\n".join(lines))
+                lines = []
+            flush()
+            level = len(heading.group("level"))
+            headings = [h for h in headings if h[0] < level]
+            headings.append((level, heading.group("title")))
+        if lines:
+            paragraphs.append("\n".join(lines))
+            words += sum(len(line.split()) for line in lines)
+        if words >= PASSAGE_WORDS:
+            flush()
+    flush()
+    return passages
+
+
+# A BM25 index over the passages of every document in a DocumentStore (see
+# lib/documents.py), kept up to date one document at a time: update() reindexes
+# a document that's been written, e.g. from a task's end event (see on_event),
+# and search() first catches up on any other document that has changed or
+# gone. Only the changed document's passages are tokenized again.
+class SearchIndex:
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        # document name -> the Document indexed, and its passage ids
+        self._documents = {}
+        self._passages = {}  # id -> (Passage, its length, its terms)
+        self._postings = {}  # term -> {id: frequency}
+        self._total_length = 0
+        self._next_id = 0
+
+    # Indexes the document again if it has changed since it was indexed, or
+    # drops it if it's gone.
+    def update(self, name):
+        try:
+            document = self.store.document(name)
+        except FileNotFoundError:
+            document = None
+        name = document.name if document is not None else os.path.basename(name)
+
+        with self._lock:
+            indexed = self._documents.get(name)
+        if indexed is not None and indexed[0] is document:
+            return
+        passages = []
+        if document is not None:
+            for passage in split_passages(document):
+                terms = Counter(tokenize(f"{passage.location}\n{passage.text}"))
+                passages.append((passage, terms))
+
+        with self._lock:
+            indexed = self._documents.pop(name, None)
+            if indexed is not None:
+                self._remove(indexed[1])
+            if document is not None:
+                ids = [self._add(passage, terms) for passage, terms in passages]
+                self._documents[name] = (document, ids)
+
+    # a lib.events.bus subscriber that indexes every markdown output_file as
+    # its task finishes
+    def on_event(self, event):
+        output_file = event.data.get("output_file") or ""
+        if (
+            event.kind == "task"
+            and event.phase == "end"
+            and output_file.endswith(".md")
+            and os.path.dirname(os.path.abspath(output_file))
+            == os.path.abspath(self.store.directory)
+        ):
+            self.update(output_file)
+
+    # The k passages that best match query, best first.
+    def search(self, query, k=5):
+        with self._lock:
+            indexed = set(self._documents)
+        for name in indexed | set(self.store.names()):
+            self.update(name)
+
+        terms = set(tokenize(query))
+        with self._lock:
+            if not self._passages:
+                return []
+            count = len(self._passages)
+            average_length = self._total_length / count
+            scores = Counter()
+            for term in terms:
+                postings = self._postings.get(term, {})
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+                for id, frequency in postings.items():
+                    length = self._passages[id][1]
+                    scores[id] += (
+                        idf
+                        * frequency
+                        * (K1 + 1)
+                        / (frequency + K1 * (1 - B + B * length / average_length))
+                    )
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [self._passages[id][0] for id, _ in best]
+
+    def _add(self, passage, terms):
+        id = self._next_id
+        self._next_id += 1
+        length = sum(terms.values())
+        self._passages[id] = (passage, length, set(terms))
+        self._total_length += length
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[id] = frequency
+        return id
+
+    def _remove(self, ids):
+        for id in ids:
+            _, length, terms = self._passages.pop(id)
+            self._total_length -= length
+            for term in terms:
+                postings = self._postings[term]
+                del postings[id]
+                if not postings:
+                    del self._postings[term]
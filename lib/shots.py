@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import re
+from collections import namedtuple
+from lib.atomic import atomic_write
+from lib.storyboard import SHOT_ID
+
+# One storyboard image: its title, and the self-contained prompt it's painted from.
+Shot = namedtuple("Shot", ["title", "prompt"])
+
+HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*\s*$")
+
+# an image embedded by illustrate, e.g. [![title](./preview)](./image)
+EMBEDDED_IMAGE = re.compile(
+    r"\[?!\[(?P<title>[^\]]*)\]\(\./(?P<preview>[^)]+)\)"
+    r"(?:\]\(\./(?P<image>[^)]+)\))?"
+)
+
+
+# The shots in a shot list written as markdown, each one a heading with its
+# title followed by its prompt. Text before the first heading is ignored. A
+# list without headings is read as one shot per paragraph.
+def parse_shot_list(text):
+    shots = []
+    title, lines = None, []
+    for line in text.splitlines():
+        heading = HEADING.match(line)
+        if heading:
+            if title is not None:
+                shots.append(Shot(title, " ".join(lines)))
+            title, lines = heading.group(1), []
+        elif line.strip():
+            lines.append(line.strip())
+    if title is not None:
+        shots.append(Shot(title, " ".join(lines)))
+
+    if not shots:
+        paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+        shots = [
+            Shot(f"Shot {i + 1}", " ".join(p.split()))
+            for i, p in enumerate(paragraphs)
+        ]
+    return [shot for shot in shots if shot.prompt]
+
+
+# named after the prompt, so an unchanged shot keeps its file
+def image_filename(prompt):
+    return f"image_{hashlib.md5(prompt.encode()).hexdigest()}.jpg"
+
+
+# Paints every shot in one batch, side by side on the ImageGenerator's
+# workers, into movie_dir, and returns the storyboard as markdown with each
+# shot's title, prompt and image. If any image fails, the rest are still
+# painted (and cached) before the first failure is raised, so a rerun only
+# repeats the ones that failed.
+#
+# With derivatives (see lib/derivatives.py), each image is shown as its
+# preview, linked to the full-size image.
+def illustrate(sd3, shots, movie_dir, style_preset, derivatives=None):
+    results = sd3.run_many(
+        [
+            (
+                shot.prompt,
+                os.path.join(movie_dir, image_filename(shot.prompt)),
+                {"style_preset": style_preset},
+            )
+            for shot in shots
+        ]
+    )
+    failed = [result for result in results if result.error is not None]
+    if failed:
+        raise Exception(
+            f"{len(failed)} of {len(results)} images failed, first: {failed[0].error}"
+        )
+
+    return "\n\n".join(
+        f"## {shot.title}\n\n{shot.prompt}\n\n"
+        + embed_image(shot.title, image_filename(shot.prompt), movie_dir, derivatives)
+        for shot in shots
+    )
+
+
+def embed_image(title, filename, movie_dir, derivatives=None):
+    image = f"![{title}](./{filename})"
+    if derivatives is None:
+        return image
+    try:
+        paths = derivatives.collect(os.path.join(movie_dir, filename))
+    except Exception as e:
+        # the full-size image will do
+        print(f"Couldn't make a preview of {filename}: {e}")
+        return image
+    preview = os.path.basename(paths[derivatives.preview_width])
+    return f"[![{title}](./{preview})](./{filename})"
+
+
+# The shots to paint for a storyboard (see lib/storyboard.py), with prompts
+# from shot_list matched to the storyboard's shots by number. A shot with no
+# prompt of its own is described from its fields instead.
+#
+# record_path keeps which prompt each shot was painted from. A shot that is
+# unchanged since then, with the same inputs (anything else its prompt was
+# written from), keeps its old prompt, and so its old image, even though the
+# shot list has been rewritten. Editing one shot of a storyboard repaints
+# just that shot.
+def storyboard_shots(shot_list, storyboard, record_path, inputs=""):
+    prompts = {}
+    for shot in parse_shot_list(shot_list):
+        number = SHOT_ID.search(shot.title)
+        prompts.setdefault(number.group("id") if number else shot.title, shot)
+
+    try:
+        with open(record_path) as f:
+            previous = json.load(f)
+    except (FileNotFoundError, ValueError):
+        previous = {}
+
+    shots = []
+    record = {}
+    for storyboard_shot in storyboard.shots:
+        key = hashlib.sha256(
+            (storyboard_shot.fingerprint() + inputs).encode()
+        ).hexdigest()
+        earlier = previous.get(storyboard_shot.id)
+        if earlier is not None and earlier["key"] == key:
+            shot = Shot(earlier["title"], earlier["prompt"])
+        elif storyboard_shot.id in prompts:
+            shot = prompts[storyboard_shot.id]
+        else:
+            # a stand-in, so it isn't recorded and the next shot list can do better
+            shots.append(Shot(f"Shot {storyboard_shot.id}", describe(storyboard_shot)))
+            continue
+        shots.append(shot)
+        record[storyboard_shot.id] = {"key": key, **shot._asdict()}
+
+    with atomic_write(record_path, "w", fsync=False) as f:
+        json.dump(record, f, indent=2)
+    return shots
+
+
+def describe(storyboard_shot):
+    details = [storyboard_shot.description]
+    if storyboard_shot.characters:
+        details.append(f"Characters: {', '.join(storyboard_shot.characters)}.")
+    if storyboard_shot.location:
+        details.append(f"Location: {storyboard_shot.location}.")
+    if storyboard_shot.camera:
+        details.append(f"Camera: {storyboard_shot.camera}.")
+    return " ".join(details)
+
+
+# The (title, preview) of every image in a storyboard made by illustrate, where
+# preview is the file name of the image's preview, or of the image itself.
+def embedded_images(markdown):
+    return [
+        (match.group("title"), match.group("preview"))
+        for match in EMBEDDED_IMAGE.finditer(markdown)
+    ]
@@ -0,0 +1,118 @@
+import hashlib
+import re
+from typing import List
+from pydantic.v1 import BaseModel, Field, validator
+
+HEADING = re.compile(r"^#{1,6}\s+(?P<title>.*)")
+SHOT_ID = re.compile(r"\b(?:shot|scene)\s+(?P<id>\w+(?:[.-]\w+)*)", re.IGNORECASE)
+FIELD = re.compile(
+    r"^[\s*_-]*(?P<name>characters|location|camera|dialogue)[\s*_]*:[\s*_]*"
+    r"(?P<value>.*?)[\s*_]*$",
+    re.IGNORECASE,
+)
+
+
+class StoryboardShot(BaseModel):
+    id: str = Field(description="The shot's number, unique within its act")
+    characters: List[str] = Field(
+        default_factory=list, description="Everyone who appears in the shot"
+    )
+    location: str = Field("", description="Where the shot takes place")
+    camera: str = Field("", description="Angle, framing and movement")
+    description: str = Field(description="What the shot shows")
+    dialogue: str = Field("", description="What's said during the shot, if anything")
+
+    # changes whenever anything about the shot does
+    def fingerprint(self):
+        return hashlib.sha256(self.json(sort_keys=True).encode()).hexdigest()
+
+
+class Storyboard(BaseModel):
+    act: str
+    shots: List[StoryboardShot]
+
+    @validator("shots")
+    def unique_ids(cls, shots):
+        ids = [shot.id for shot in shots]
+        duplicates = sorted({id for id in ids if ids.count(id) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate shot ids: {duplicates}")
+        return shots
+
+
+# How storyboard_act is asked to lay out each shot, so parse_storyboard can
+# read it back.
+SHOT_FORMAT = """## Shot <number>
+Characters: <everyone in the shot, comma separated>
+Location: <where it takes place>
+Camera: <angle, framing and movement>
+Dialogue: <what's said, or nothing>
+
+<the description of the shot, in one paragraph>"""
+
+
+# Reads a storyboard written in SHOT_FORMAT into a Storyboard. It's forgiving,
+# since it's reading an LLM's work: fields can be missing, bolded or in any
+# order, a storyboard without headings is read as one shot per paragraph, and
+# shots with the same number are told apart with a suffix.
+def parse_storyboard(text, act):
+    lines = text.splitlines()
+    headings = [HEADING.match(line) for line in lines]
+    # when any heading names its shot, other headings (an introduction, notes)
+    # aren't shots, and neither is anything under them
+    numbered = any(
+        heading and SHOT_ID.search(heading.group("title")) for heading in headings
+    )
+
+    sections = []
+    section = None
+    for line, heading in zip(lines, headings):
+        if heading:
+            shot_id = SHOT_ID.search(heading.group("title"))
+            if shot_id:
+                section = (shot_id.group("id"), [])
+            elif not numbered:
+                section = (str(len(sections) + 1), [])
+            else:
+                section = None
+            if section is not None:
+                sections.append(section)
+        elif section is not None:
+            section[1].append(line)
+
+    if not any(headings):
+        paragraphs = [p for p in re.split(r"\n\s*\n", text) if p.strip()]
+        sections = [(str(i + 1), p.splitlines()) for i, p in enumerate(paragraphs)]
+
+    shots = []
+    seen = set()
+    for id, lines in sections:
+        fields = {}
+        description = []
+        for line in lines:
+            field = FIELD.match(line)
+            if field:
+                fields[field.group("name").lower()] = field.group("value")
+            elif line.strip():
+                description.append(line.strip())
+        if not description:
+            continue
+
+        unique_id, n = id, 1
+        while unique_id in seen:
+            n += 1
+            unique_id = f"{id}-{n}"
+        seen.add(unique_id)
+
+        characters = fields.get("characters", "")
+        shots.append(
+            StoryboardShot(
+                id=unique_id,
+                characters=[c.strip() for c in characters.split(",") if c.strip()],
+                location=fields.get("location", ""),
+                camera=fields.get("camera", ""),
+                description=" ".join(description),
+                dialogue=fields.get("dialogue", ""),
+            )
+        )
+    return Storyboard(act=act, shots=shots)
@@ -1,22 +1,11 @@
-import sys
+import os
 import time
 import streamlit as st
-from crewai import Agent, Task, Crew, Process
-from langchain.agents import Tool
-from langchain_openai import ChatOpenAI
-import os
-import re
-from pydantic.v1 import BaseModel, Field
-from crewai_tools import (
-    DirectoryReadTool,
-    FileReadTool,
-)
-import hashlib
-from lib.sd3 import ImageGenerator, ImageStylePresets
+from lib.sd3 import SD3_URL, ImageStylePresets
+from lib.jobs import JobQueue
 
 # read our environment from .env
 from dotenv import load_dotenv
-import os
 
 load_dotenv()
 
@@ -26,13 +15,9 @@ load_dotenv()
 #       base_url="http://localhost:11434/v1",
 #       api_key="NA"
 #     )
-
-llm = ChatOpenAI(model="gpt-4-turbo", verbose=True)
-sd3 = ImageGenerator(os.environ.get("STABILITY_API_KEY"))
-
-# to keep track of tasks performed by agents
-task_values = []
-
+#
+# To run without live API keys, start `python -m lib.fixtures replay` and set
+# OPENAI_BASE_URL and STABILITY_API_URL to the URLs it prints.
 
 scripts_dir = os.path.join(os.path.dirname(__file__), "scripts")
 
@@ -41,420 +26,195 @@ if not os.path.exists(scripts_dir):
     os.makedirs(scripts_dir)
 
 
-class SimpleDoc(BaseModel):
-    text: str = Field(title="Text", description="The text to save, in Markdown format")
+# The LLM, the image generator and their caches are built the first time a
+# movie needs them and then shared by every session and rerun. crewai and
+# langchain take seconds to import, so rendering the page doesn't import them.
+@st.cache_resource
+def clients():
+    from lib.crew import Clients
+    from lib.derivatives import DEFAULT_PREVIEW_WIDTH, DEFAULT_WIDTHS, Derivatives
+    from lib.events import image_callback
+    from lib.image_cache import ImageCache
+    from lib.llm_backends import LLMRegistry
+    from lib.llm_cache import SQLiteCompletionCache
+    from lib.llm_events import LLMEventHandler, OutputStreamer
+    from lib.sd3 import ImageGenerator
+
+    # set LLM_CACHE=1 to reuse completions for identical prompts, e.g. when rerunning a movie
+    llm_cache = None
+    if os.environ.get("LLM_CACHE"):
+        llm_cache = SQLiteCompletionCache(
+            os.environ.get(
+                "LLM_CACHE_PATH", os.path.join(scripts_dir, ".llm_cache.sqlite")
+            ),
+            ttl=float(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 60 * 60)),
+            max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 10000)),
+        )
 
+    # emits structured llm events, see lib/llm_events.py
+    llm_events = LLMEventHandler()
+
+    # set LLM_CONFIG to a JSON file to run tasks and agents on other models or
+    # endpoints, see lib/llm_backends.py; by default everything runs on gpt-4-turbo.
+    # It's read once, here, so every movie this process writes uses the same
+    # backends, and a change only takes effect after a restart
+    # OutputStreamer writes each task's answer into <output_file>.partial as
+    # it's generated, so it can be read before the task is done
+    llm_options = {
+        "verbose": True,
+        "cache": llm_cache,
+        "callbacks": [llm_events, OutputStreamer()],
+    }
+    if os.environ.get("LLM_CONFIG"):
+        llms = LLMRegistry.from_config(os.environ["LLM_CONFIG"], **llm_options)
+    else:
+        llms = LLMRegistry(**llm_options)
+
+    # generated images are cached across all movies, so unchanged shots are free to re-run
+    image_cache = ImageCache(
+        os.environ.get("IMAGE_CACHE_DIR", os.path.join(scripts_dir, ".image_cache")),
+        max_bytes=int(os.environ.get("IMAGE_CACHE_MAX_MB", 2048)) * 1024 * 1024,
+    )
+    # every image also gets smaller WebP copies, made in worker processes as
+    # it lands, which the storyboards show in its place
+    widths = os.environ.get("THUMBNAIL_WIDTHS")
+    derivatives = Derivatives(
+        os.environ.get(
+            "DERIVATIVE_CACHE_DIR", os.path.join(scripts_dir, ".derivatives")
+        ),
+        widths=[int(w) for w in widths.split(",")] if widths else DEFAULT_WIDTHS,
+        preview_width=int(
+            os.environ.get("THUMBNAIL_PREVIEW_WIDTH", DEFAULT_PREVIEW_WIDTH)
+        ),
+        max_workers=int(os.environ.get("THUMBNAIL_WORKERS", 0)) or None,
+    )
+    sd3 = ImageGenerator(
+        os.environ.get("STABILITY_API_KEY"),
+        cache=image_cache,
+        max_workers=int(os.environ.get("STABILITY_MAX_WORKERS", 4)),
+        max_retries=int(os.environ.get("STABILITY_MAX_RETRIES", 4)),
+        connect_timeout=float(os.environ.get("STABILITY_CONNECT_TIMEOUT", 10)),
+        read_timeout=float(os.environ.get("STABILITY_READ_TIMEOUT", 120)),
+        url=os.environ.get("STABILITY_API_URL", SD3_URL),
+        callbacks=[image_callback(), derivatives.on_image],
+    )
 
-# make sure it exists
-if not os.path.exists(scripts_dir):
-    os.makedirs(scripts_dir)
+    return Clients(llms, llm_cache, llm_events, image_cache, sd3, derivatives)
 
 
+# writes the movie into scripts/<movie_slug>, see lib/crew.py
 def create_crewai_setup(
     movie_slug,
     movie_name,
     movie_genre="Action",
     storyboard_visual_style=ImageStylePresets.COMIC_BOOK.value,
     movie_idea="A heist movie",
+    max_workers=1,
+    thread_initializer=None,
+    incremental=True,
+    num_acts=3,
+    compact=False,
 ):
+    from lib.crew import write_movie
 
-    # make sure the movie_slug directory exists in scripts_dir
-    movie_dir = os.path.join(scripts_dir, movie_slug)
-
-    print("movie_dir", movie_dir)
-
-    # ensure that movie_dir exists
-    if not os.path.exists(movie_dir):
-        os.makedirs(movie_dir)
-
-    # write an initial idea into f"{movie_dir}/idea_original.md"
-    with open(f"{movie_dir}/idea_original.md", "w") as f:
-        f.write(
-            f"""# {movie_name}
-Genre: {movie_genre}
-
-## Plot
-{movie_idea}
-"""
-        )
-
-    docs_tool = DirectoryReadTool(directory=movie_dir)
-    file_tool = FileReadTool()
-
-    def run_and_store_image(description):
-        image_filename = f"image_{hashlib.md5(description.encode()).hexdigest()}.jpg"
-        image_path = os.path.join(
-            movie_dir, f"{image_filename}"
-        )
-        sd3.run(
-            description,
-            image_path,
-            style_preset=storyboard_visual_style,
-        )
-        return f"./{image_filename}"
-
-    image_generator_tool = Tool(
-        "ImageGenerator",
-        run_and_store_image,
-        "The Image Generator. Useful for when you need to generate images from a text description. Input should be an image description, output is a file path.",
-    )
-
-    # Define Agents
-    screenwriter = Agent(
-        role="Screenwriter",
-        goal=f"""Establish the premise, setting and write the dialog for {movie_name}, and integrate any feedback. You run the writers room and debate the best way to approproach the story.""",
-        backstory=f"""Your name is Daniel Walmsley. You are the writer for "{movie_name}". You are a master in the {movie_genre} genre. Your inspirations are Shakespeare and Quentin Tarantino.""",
-        verbose=True,
-        allow_delegation=True,
-        tools=[
-            docs_tool,
-            file_tool,
-        ],
-        llm=llm,
-    )
-
-    cinematographer = Agent(
-        role="Cinematographer",
-        goal=f"""Create a visual style for {movie_name} based on the treatment provided by the screenwriter. You will be responsible for the look and feel of the movie.""",
-        backstory=f"""You are the cinematographer for "{movie_name}". Your inspirations are Roger Deakins and Emmanuel Lubezki.""",
-        verbose=True,
-        allow_delegation=True,
-        tools=[
-            docs_tool,
-            file_tool,
-        ],
-        llm=llm,
-    )
-
-    script_consultant = Agent(
-        role="Script Consultant",
-        goal=f"""Provide feedback on the script for {movie_name} and suggest improvements.""",
-        backstory=f"""You are a script consultant for "{movie_name}". Your inspirations are Nora Ephron and David Mamet.""",
-        verbose=True,
-        allow_delegation=True,
-        tools=[
-            docs_tool,
-            file_tool,
-        ],
-        llm=llm,
-    )
-
-    writer = Agent(
-        role="Writer",
-        goal=f"""Write the dialog for {movie_name} based on the outline provided by the screenwriter. You will also be responsible for integrating any feedback.""",
-        backstory=f"""You are a writer for "{movie_name}". Your inspirations are J.K. Rowling and Aaron Sorkin.""",
-        verbose=True,
-        allow_delegation=False,
-        tools=[
-            docs_tool,
-            file_tool,
-        ],
-        llm=llm,
-    )
-
-    director = Agent(
-        role="Director",
-        goal=f"""Turn the script for "{movie_name}" into storyboards, and plan the shots and angles for the film. You will also be responsible for casting and overseeing the production.""",
-        backstory=f"""You are the director for "{movie_name}". Your inspirations are Steven Spielberg and Alfred Hitchcock.""",
-        verbose=True,
-        allow_delegation=True,
-        tools=[
-            docs_tool,
-            file_tool,
-        ],
-        llm=llm,
-    )
-
-    producer = Agent(
-        role="Producer",
-        goal=f"""Ensure that "{movie_name}" has all the elements it needs to be successful, including marketing materials and product placement.""",
-        backstory=f"""You are the producer for "{movie_name}". Your inspirations are Jerry Bruckheimer and Kathleen Kennedy.""",
-        verbose=True,
-        allow_delegation=True,
-        llm=llm,
-        tools=[
-            docs_tool,
-            file_tool,
-        ],
-    )
-
-    # Define Tasks
-    define_plot = Task(
-        description=f"""Establish the plot, setting, and characters for {movie_name}, in the {movie_genre} genre. In brief, the main idea is: {movie_idea}.""",
-        expected_output="A one-pager with the title, subtitle (if any), plot, setting, and characters for the movie. Ask the script consultant for any feedback and integrate it into your work.",
-        agent=screenwriter,
-        output_file=f"{movie_dir}/idea_final.md",
-    )
-
-    write_treatment = Task(
-        description=f"""\
-            Write a treatment for {movie_name} based on the plot, setting, and characters in the {movie_genre} genre based on the file {movie_dir}/idea_final.md.
-            Consult with the script consultant and writer to integrate any feedback. Be sure it remains true to the original idea: {movie_idea}
-        """,
-        expected_output="A concise treatment for the movie, no more than 10 pages, including title, logline, characters and synopsis. Also be sure to include a detailed description of the art style, color scheme, etc.",
-        agent=screenwriter,
-        output_file=f"{movie_dir}/treatment.md",
-        context=[define_plot],
-    )
-
-    # director_review_treatment = Task(
-    #     description=f"""Review the treatment for {movie_name} and provide feedback based on the file in {movie_dir}/treatment_draft.md. Ensure that the movie will be cinematic, moving, funny and suspenseful.""",
-    #     expected_output="Feedback on the treatment for the movie.",
-    #     agent=director,
-    #     output_file=f"{movie_dir}/treatment_review.md",
-    #     context=[write_treatment],
-    # )
-
-    # treatment_final = Task(
-    #     description=f"""Finalize the treatment for {movie_name} based on the feedback in the file {movie_dir}/treatment_review.md. Ensure that the movie will be cinematic, moving, funny and suspenseful.""",
-    #     expected_output="The final treatment for the movie.",
-    #     agent=screenwriter,
-    #     output_file=f"{movie_dir}/treatment_final.md",
-    #     context=[write_treatment, director_review_treatment],
-    # )
-
-    write_lookbook = Task(
-        description=f"""Create a lookbook for the visual style of {movie_name} based on the treatment in the file {movie_dir}/treatment.md. Include images, color schemes, art style, and any other visual references that will help the cinematographer and director. In place of actual images include extremely detailed visual descriptions. Be sure to include the visual style - e.g. cartoon, 3d animation, live action, etc.""",
-        expected_output="A lookbook for the visual style of the movie.",
-        agent=cinematographer,
-        output_file=f"{movie_dir}/lookbook.md",
-        context=[write_treatment],
-    )
-
-    def write_script_act(
-        movie_name, movie_dir, act_description, act_file, agent, context=[]
-    ):
-        return Task(
-            description=f"""Write the {act_description} script for {movie_name} based on the treatment in the file {movie_dir}/treatment.md, in the {movie_genre} genre. Consult with the screenwriter, script consultant, and director to integrate any feedback.""",
-            expected_output=f"The complete {act_description} of the movie script.",
-            agent=agent,
-            output_file=f"{movie_dir}/{act_file}",
-            context=context,
-        )
-
-    write_first_act = write_script_act(
+    return write_movie(
+        clients(),
+        os.path.join(scripts_dir, movie_slug),
         movie_name,
-        movie_dir,
-        "first act",
-        "first_act_draft.md",
-        screenwriter,
-        context=[write_treatment],
+        movie_genre=movie_genre,
+        storyboard_visual_style=storyboard_visual_style,
+        movie_idea=movie_idea,
+        max_workers=max_workers,
+        thread_initializer=thread_initializer,
+        incremental=incremental,
+        num_acts=num_acts,
+        compact=compact,
+        summary_words=int(os.environ.get("ACT_SUMMARY_WORDS", 300)),
+        context_tokens=int(os.environ.get("CONTEXT_TOKEN_BUDGET", 0)) or None,
     )
 
-    write_second_act = write_script_act(
-        movie_name,
-        movie_dir,
-        "second act",
-        "second_act_draft.md",
-        screenwriter,
-        context=[write_treatment, write_first_act],
-    )
 
-    write_third_act = write_script_act(
-        movie_name,
-        movie_dir,
-        "third act",
-        "third_act_draft.md",
-        screenwriter,
-        context=[write_treatment, write_first_act, write_second_act],
+# crews run in the background, so a run survives reruns of this script, and
+# at most MAX_CONCURRENT_CREWS of them run at once; the rest wait their turn
+@st.cache_resource
+def job_queue():
+    return JobQueue(
+        os.path.join(scripts_dir, ".jobs"),
+        max_workers=int(os.environ.get("MAX_CONCURRENT_CREWS", 2)),
     )
 
-    def create_storyboard_task(
-        movie_name, movie_dir, act_description, storyboard_file, context=[]
-    ):
-        return Task(
-            description=f"""Create a storyboard for the {act_description} of {movie_name} based on the {act_description}. Descrbe each scene on its own paragraph, as if describing the frames on the storyboard. Make the descriptions rich enough for our artists to paint the scenes, with angle, pose, and detailed character information.""",
-            expected_output=f"Storyboard for the {act_description} of the movie.",
-            agent=director,
-            output_file=f"{movie_dir}/{storyboard_file}",
-            context=context,
-        )
 
-    storyboard_first_act = create_storyboard_task(
-        movie_name,
-        movie_dir,
-        "first act",
-        "first_act_storyboard_draft.md",
-        context=[write_first_act],
-    )
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 2))
 
-    storyboard_second_act = create_storyboard_task(
-        movie_name,
-        movie_dir,
-        "second act",
-        "second_act_storyboard_draft.md",
-        context=[write_second_act, storyboard_first_act],
-    )
 
-    storyboard_third_act = create_storyboard_task(
-        movie_name,
-        movie_dir,
-        "third act",
-        "third_act_storyboard_draft.md",
-        context=[write_third_act, storyboard_first_act, storyboard_second_act],
-    )
+def show_job(job):
+    st.header(f"{job.name}:")
+    elapsed = (job.finished or time.time()) - (job.started or time.time())
+    st.text(f"{job.status.capitalize()} - Total Time Elapsed: {elapsed:.2f} seconds")
 
-    def envision_storyboard_task(
-        movie_name,
-        movie_dir,
-        act_description,
-        storyboard_file,
-        image_file,
-        context=[],
-    ):
-        return Task(
-            description=f"""Create a storyboard of images for the {act_description} of {movie_name} based on the storyboard in {storyboard_file}.
-            The style of the images is {storyboard_visual_style}.
-            Also consult the overview of the movie in idea_final.md and the lookbook in lookbook.md.
-            Include a detailed description of the visual style and each character that is as consistent as possible, giving the world a consistent tone, color palette, and style across images.
-            Always include character full names and descriptions, like "John Smith, a tall man with long brown hair, pale skin, pointed nose, long brown coat", etc, with every generated image. Include the SAME description of the character in EVERY description sent to the ImageGenerator tool that includes that character.
-            Include consistent and detailed scene/environment descriptions, like "gothic noir cityscape with neon lights and rain", etc, with every generated image. Include the SAME description of the scene in EVERY description sent to the ImageGenerator tool that is in that environment.
-            If a character is old, young, tall, short, has a certain hair or clothing style, then specify that in the description.
-            Always include specific tonal prompts that reflect the image style, like "dark and moody" or "bright and colorful".
-            Include specific camera and framing details like "from above" or "close-up" or "wide shot".
-            Clearly describe what is in the foreground, what is in the background, and any costumers or other details that are important.
-            Clearly describe the relationship between the characters, for example whether one is pointing at another, or one is looking at another, or standing in front or behind the other.
-            Include an image for every scene in the storyboard. Do not skip any images. Do not repeat any images.
-            Where necessary, add a text bubble by saying "a speech bubble over [character name]'s head says 'I am a robot'".
-            YOU MUST FEED THE ENTIRE DESCRIPTION INTO THE ImageGenerator TOOL. DO NOT SKIP ANY DETAILS and repeat all the common details for each image to ensure a consistent style.
-            Use the ImageGenerator tool whenever you need to create an image and provide all the details I specified in the image description.
-            Link to the file returned by ImageGenerator in the markdown output.""",
-            expected_output=f"Storyboard for the {act_description} of the movie in markdown format with shot title, scene description and full embedded image. Do NOT wrap it in a code block.",
-            agent=director,
-            tools=[docs_tool, file_tool, image_generator_tool],
-            output_file=f"{movie_dir}/{image_file}",
-            context=context,
+    if job.active:
+        st.progress(
+            job.tasks_done / job.tasks_total if job.tasks_total else 0.0,
+            text=f"{job.tasks_done}/{job.tasks_total or '?'} tasks done"
+            + (f", working on {job.current_task}" if job.current_task else ""),
         )
+        # what the current task has written so far
+        if job.current_output:
+            from lib.outputs import read_output
 
-    envision_first_act_storyboard = envision_storyboard_task(
-        movie_name,
-        movie_dir,
-        "first act",
-        "first_act_storyboard_draft.md",
-        "first_act_images.md",
-        context=[write_treatment, write_lookbook, storyboard_first_act],
-    )
+            output = read_output(job.current_output)
+            if output:
+                with st.expander(f"Writing {job.current_task}", expanded=True):
+                    st.markdown(output)
 
-    envision_second_act_storyboard = envision_storyboard_task(
-        movie_name,
-        movie_dir,
-        "second act",
-        "second_act_storyboard_draft.md",
-        "second_act_images.md",
-        context=[write_treatment, write_lookbook, storyboard_second_act],
-    )
-
-    envision_third_act_storyboard = envision_storyboard_task(
-        movie_name,
-        movie_dir,
-        "third act",
-        "third_act_storyboard_draft.md",
-        "third_act_images.md",
-        context=[write_treatment, write_lookbook, storyboard_third_act],
-    )
+        with st.expander("Processing!", expanded=True):
+            st.markdown("  \n".join(job_queue().tail(job.id)), unsafe_allow_html=True)
 
-    # Create and Run the Crew
-    product_crew = Crew(
-        agents=[screenwriter, director, producer, writer, script_consultant],
-        tasks=[
-            # define_plot,
-            # write_treatment,
-            # # director_review_treatment,
-            # # treatment_final,
-            # write_lookbook,
-            # write_first_act,
-            # write_second_act,
-            # write_third_act,
-            # storyboard_first_act,
-            # storyboard_second_act,
-            # storyboard_third_act,
-            envision_first_act_storyboard,
-            envision_second_act_storyboard,
-            envision_third_act_storyboard,
-        ],
-        verbose=2,
-        process=Process.sequential,
-    )
+        # check back for progress
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
 
-    crew_result = product_crew.kickoff()
-    return crew_result
+    if job.status == "failed":
+        st.error(job.error)
 
+    st.header("Image Requests:")
+    st.json({**clients().sd3.stats(), **clients().image_cache.stats()})
 
-# display the console processing on streamlit UI
-class StreamToExpander:
-    def __init__(self, expander):
-        self.expander = expander
-        self.buffer = []
-        self.colors = ["red", "green", "blue", "orange"]  # Define a list of colors
-        self.color_index = 0  # Initialize color index
-
-    def write(self, data):
-        # Filter out ANSI escape codes using a regular expression
-        cleaned_data = re.sub(r"\x1B\[[0-9;]*[mK]", "", data)
-
-        # Check if the data contains 'task' information
-        task_match_object = re.search(
-            r"\"task\"\s*:\s*\"(.*?)\"", cleaned_data, re.IGNORECASE
-        )
-        task_match_input = re.search(
-            r"task\s*:\s*([^\n]*)", cleaned_data, re.IGNORECASE
-        )
-        task_value = None
-        if task_match_object:
-            task_value = task_match_object.group(1)
-        elif task_match_input:
-            task_value = task_match_input.group(1).strip()
-
-        if task_value:
-            st.toast(":robot_face: " + task_value)
-
-        # Check if the text contains the specified phrase and apply color
-        if "Entering new CrewAgentExecutor chain" in cleaned_data:
-            # Apply different color and switch color index
-            self.color_index = (self.color_index + 1) % len(
-                self.colors
-            )  # Increment color index and wrap around if necessary
-
-            cleaned_data = cleaned_data.replace(
-                "Entering new CrewAgentExecutor chain",
-                f":{self.colors[self.color_index]}[Entering new CrewAgentExecutor chain]",
-            )
+    if clients().llm_cache is not None:
+        st.header("LLM Cache:")
+        st.json(clients().llm_cache.stats())
 
-        if "Producer" in cleaned_data:
-            cleaned_data = cleaned_data.replace(
-                "Producer", f":{self.colors[self.color_index]}[Producer]"
-            )
-
-        if "Director" in cleaned_data:
-            cleaned_data = cleaned_data.replace(
-                "Director", f":{self.colors[self.color_index]}[Director]"
-            )
-
-        if "Screenwriter" in cleaned_data:
-            cleaned_data = cleaned_data.replace(
-                "Screenwriter", f":{self.colors[self.color_index]}[Screenwriter]"
-            )
-
-        if "Script Consultant" in cleaned_data:
-            cleaned_data = cleaned_data.replace(
-                "Script Consultant",
-                f":{self.colors[self.color_index]}[Script Consultant]",
-            )
-
-        if "Writer" in cleaned_data:
-            cleaned_data = cleaned_data.replace(
-                "Writer", f":{self.colors[self.color_index]}[Writer]"
-            )
-
-        if "Finished chain." in cleaned_data:
-            cleaned_data = cleaned_data.replace(
-                "Finished chain.", f":{self.colors[self.color_index]}[Finished chain.]"
+    if job.metrics:
+        st.header("Tasks:")
+        st.table(job.metrics["tasks"])
+
+        st.header("Calls:")
+        st.table(job.metrics["totals"])
+
+    # every act's storyboard, as the previews of its images
+    storyboards = []
+    if job.params.get("movie_slug"):
+        from lib.acts import ACT_NAMES
+        from lib.shots import embedded_images
+
+        movie_dir = os.path.join(scripts_dir, job.params["movie_slug"])
+        for act in ACT_NAMES:
+            path = os.path.join(movie_dir, f"{act}_act_images.md")
+            if os.path.exists(path):
+                with open(path) as f:
+                    storyboards.append((act, embedded_images(f.read())))
+    if storyboards:
+        st.header("Storyboard:")
+        for act, images in storyboards:
+            st.subheader(f"{act.capitalize()} act")
+            st.image(
+                [os.path.join(movie_dir, preview) for _, preview in images],
+                caption=[title for title, _ in images],
             )
 
-        self.buffer.append(cleaned_data)
-        if "\n" in data:
-            self.expander.markdown("".join(self.buffer), unsafe_allow_html=True)
-            self.buffer = []
+    if job.result:
+        st.header("Results:")
+        st.markdown(job.result)
 
 
 # Streamlit interface
@@ -484,34 +244,54 @@ def run_crewai_app():
         "A hilarious childrens animated adventure about Little Bean (real name: Lola), a neurotic little white chihuaha/something cross, and Tiger, a brave ginger cat. Together they have to get to Nevada City to save their owner Indigo from a math-related disaster...",
     )
 
-    if st.button("Write Movie"):
-        # Placeholder for stopwatch
-        stopwatch_placeholder = st.empty()
-
-        # Start the stopwatch
-        start_time = time.time()
-        with st.expander("Processing!"):
-            sys.stdout = StreamToExpander(st)
-            with st.spinner("Generating Results"):
-                crew_result = create_crewai_setup(
-                    movie_slug,
-                    movie_name,
-                    movie_genre=movie_genre,
-                    storyboard_visual_style=storyboard_image_style,
-                    movie_idea=movie_idea,
-                )
-
-        # Stop the stopwatch
-        end_time = time.time()
-        total_time = end_time - start_time
-        stopwatch_placeholder.text(f"Total Time Elapsed: {total_time:.2f} seconds")
+    max_workers = st.number_input(
+        "How many tasks to run in parallel (1 runs them one after another)",
+        min_value=1,
+        max_value=8,
+        value=1,
+    )
 
-        st.header("Tasks:")
-        st.table({"Tasks": task_values})
+    incremental = st.checkbox(
+        "Only rerun tasks whose inputs have changed since the last run", value=True
+    )
 
-        st.header("Results:")
-        st.markdown(crew_result)
+    compact = st.checkbox(
+        "Summarize each act for the ones after it, to keep prompts short on long movies"
+    )
+
+    st.sidebar.header("Recent Jobs")
+    st.sidebar.table(
+        [{"job": job.name, "status": job.status} for job in job_queue().jobs()[:10]]
+    )
 
+    if st.button("Write Movie"):
+        try:
+            job = job_queue().submit(
+                f"{movie_name} ({movie_slug})",
+                create_crewai_setup,
+                key=movie_slug,
+                params={
+                    "movie_slug": movie_slug,
+                    "movie_name": movie_name,
+                    "movie_genre": movie_genre,
+                    "storyboard_visual_style": storyboard_image_style,
+                    "movie_idea": movie_idea,
+                    "max_workers": max_workers,
+                    "incremental": incremental,
+                    "compact": compact,
+                },
+                # the full console log and every event, in the movie directory
+                log_path=os.path.join(scripts_dir, movie_slug, "crew.log"),
+                events_path=os.path.join(scripts_dir, movie_slug, "events.jsonl"),
+            )
+            st.session_state["job_id"] = job.id
+        except ValueError as e:
+            st.error(str(e))
+
+    # this session's latest job, still running or not
+    job = job_queue().get(st.session_state.get("job_id"))
+    if job is not None:
+        show_job(job)
 
 if __name__ == "__main__":
     run_crewai_app()
@@ -1,18 +1,11 @@
 import sys
 import time
 import streamlit as st
-from crewai import Agent, Task, Crew, Process
-from langchain.agents import Tool
-from langchain_openai import ChatOpenAI
 import os
 import re
 from pydantic.v1 import BaseModel, Field
-from crewai_tools import (
-    DirectoryReadTool,
-    FileReadTool,
-)
 import hashlib
-from lib.sd3 import ImageGenerator, ImageStylePresets
+from lib.sd3 import SD3_URL, ImageGenerator, ImageStylePresets
 # read our environment from .env
 from dotenv import load_dotenv
 
@@ -24,13 +17,9 @@ load_dotenv()
 #       base_url="http://localhost:11434/v1",
 #       api_key="NA"
 #     )
-
-llm = ChatOpenAI(model="gpt-4-turbo", verbose=True)
-sd3 = ImageGenerator(os.environ.get("STABILITY_API_KEY"))
-
-# to keep track of tasks performed by agents
-task_values = []
-
+#
+# To run without live API keys, start `python -m lib.fixtures replay` and set
+# OPENAI_BASE_URL and STABILITY_API_URL to the URLs it prints.
 
 scripts_dir = os.path.join(os.path.dirname(__file__), "scripts")
 
@@ -38,18 +27,47 @@ scripts_dir = os.path.join(os.path.dirname(__file__), "scripts")
 if not os.path.exists(scripts_dir):
     os.makedirs(scripts_dir)
 
-class SimpleDoc(BaseModel):
-    text: str = Field(title="Text", description="The text to save, in Markdown format")
 
+# built on first use and shared across reruns, see main.py
+@st.cache_resource
+def clients():
+    from lib.llm_cache import CachedChatOpenAI, SQLiteCompletionCache
 
-# make sure it exists
-if not os.path.exists(scripts_dir):
-    os.makedirs(scripts_dir)
+    # set LLM_CACHE=1 to reuse completions for identical prompts, e.g. when rerunning a movie
+    llm_cache = None
+    if os.environ.get("LLM_CACHE"):
+        llm_cache = SQLiteCompletionCache(
+            os.environ.get("LLM_CACHE_PATH", os.path.join(scripts_dir, ".llm_cache.sqlite")),
+            ttl=float(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 60 * 60)),
+            max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 10000)),
+        )
+
+    llm = CachedChatOpenAI(model="gpt-4-turbo", verbose=True, cache=llm_cache)
+    sd3 = ImageGenerator(
+        os.environ.get("STABILITY_API_KEY"),
+        url=os.environ.get("STABILITY_API_URL", SD3_URL),
+    )
+    return llm, sd3
+
+
+# to keep track of tasks performed by agents
+task_values = []
+
+
+class SimpleDoc(BaseModel):
+    text: str = Field(title="Text", description="The text to save, in Markdown format")
 
 
 def create_crewai_setup(
     movie_slug, movie_name, movie_genre="Action", movie_visual_style="Cartoon", movie_idea="A heist movie"
 ):
+    # crewai and langchain are slow to import, so only load them for a run
+    from crewai import Agent, Task, Crew, Process
+    from crewai_tools import DirectoryReadTool, FileReadTool
+    from langchain.agents import Tool
+    from lib.crew_runner import own_callbacks
+
+    llm, sd3 = clients()
 
     # make sure the movie_slug directory exists in scripts_dir
     movie_dir = os.path.join(scripts_dir, movie_slug)
@@ -76,7 +94,7 @@ Genre: {movie_genre}
 
     def run_and_store_image(description):
         image_path = os.path.join(movie_dir, f"image_{hashlib.md5(description.encode()).hexdigest()}.jpg")
-        sd3.run("a cinematic photograph of a dog wearing black glasses", image_path)
+        sd3.run(description, image_path)
         return image_path
 
     image_generator_tool = Tool(
@@ -96,7 +114,7 @@ Genre: {movie_genre}
             docs_tool,
             file_tool,
         ],
-        llm=llm,
+        llm=own_callbacks(llm),
     )
 
     cinematographer = Agent(
@@ -109,7 +127,7 @@ Genre: {movie_genre}
             docs_tool,
             file_tool,
         ],
-        llm=llm,
+        llm=own_callbacks(llm),
     )
 
     script_consultant = Agent(
@@ -122,7 +140,7 @@ Genre: {movie_genre}
             docs_tool,
             file_tool,
         ],
-        llm=llm,
+        llm=own_callbacks(llm),
     )
 
     writer = Agent(
@@ -135,7 +153,7 @@ Genre: {movie_genre}
             docs_tool,
             file_tool,
         ],
-        llm=llm,
+        llm=own_callbacks(llm),
     )
 
     director = Agent(
@@ -148,7 +166,7 @@ Genre: {movie_genre}
             docs_tool,
             file_tool,
         ],
-        llm=llm,
+        llm=own_callbacks(llm),
     )
 
     producer = Agent(
@@ -157,7 +175,7 @@ Genre: {movie_genre}
         backstory=f"""You are the producer for "{movie_name}". Your inspirations are Jerry Bruckheimer and Kathleen Kennedy.""",
         verbose=True,
         allow_delegation=True,
-        llm=llm,
+        llm=own_callbacks(llm),
         tools=[
             docs_tool,
             file_tool,
@@ -0,0 +1,53 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from lib.derivatives import Derivatives  # noqa: E402
+
+
+@pytest.fixture
+def derivatives(tmp_path):
+    derivatives = Derivatives(
+        str(tmp_path / "cache"), widths=(32, 64), preview_width=64, max_workers=1
+    )
+    yield derivatives
+    if derivatives._executor is not None:
+        derivatives._executor.shutdown()
+
+
+def make_image(path, color="red"):
+    Image.new("RGB", (128, 72), color).save(path, "JPEG")
+    return str(path)
+
+
+def test_derivatives_are_made_at_each_width(derivatives, tmp_path):
+    path = make_image(tmp_path / "image.jpg")
+
+    derivatives.on_image("a red frame", path, 0.1, False)
+    paths = derivatives.collect(path)
+
+    assert sorted(paths) == [32, 64]
+    with Image.open(paths[32]) as image:
+        assert image.size == (32, 18)
+
+
+def test_a_failure_doesnt_fail_the_image(derivatives, tmp_path, capsys):
+    derivatives.on_image("a lost frame", str(tmp_path / "missing.jpg"), 0.1, False)
+
+    assert "Couldn't start making derivatives" in capsys.readouterr().out
+
+
+def test_a_dead_worker_doesnt_break_later_images(derivatives, tmp_path):
+    first = make_image(tmp_path / "first.jpg")
+    derivatives.on_image("a red frame", first, 0.1, False)
+    # kill the pool's only worker, which breaks the pool
+    with pytest.raises(BrokenProcessPool):
+        derivatives._executor.submit(os._exit, 1).result()
+
+    second = make_image(tmp_path / "second.jpg", "blue")
+    derivatives.on_image("a blue frame", second, 0.1, False)
+
+    assert sorted(derivatives.collect(second)) == [32, 64]
+    assert sorted(derivatives.collect(first)) == [32, 64]
@@ -0,0 +1,95 @@
+import os
+import pytest
+from lib.image_cache import INDEX_FILE, ImageCache
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def cache_image(cache, tmp_path, prompt, data):
+    key = ImageCache.key(prompt, "comic-book", "16:9", "jpeg")
+    cache.put(key, write(tmp_path / f"{prompt}.jpg", data))
+    return key
+
+
+def test_a_cached_image_is_copied_to_the_path_asked_for(tmp_path):
+    cache = ImageCache(str(tmp_path / "cache"))
+    key = cache_image(cache, tmp_path, "dog", b"a dog")
+
+    assert cache.get(key, str(tmp_path / "copy.jpg"))
+    assert (tmp_path / "copy.jpg").read_bytes() == b"a dog"
+    assert not cache.get("unknown", str(tmp_path / "other.jpg"))
+    assert not (tmp_path / "other.jpg").exists()
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_keys_change_with_anything_that_changes_the_image():
+    key = ImageCache.key("dog", "comic-book", "16:9", "jpeg")
+
+    assert key == ImageCache.key("dog", "comic-book", "16:9", "jpeg")
+    assert key != ImageCache.key("dog", "anime", "16:9", "jpeg")
+    assert key != ImageCache.key("dog", "comic-book", "16:9", "jpeg", seed=1)
+    assert key != ImageCache.key(
+        "dog", "comic-book", "16:9", "jpeg", endpoint="http://127.0.0.1:8765"
+    )
+
+
+def test_the_least_recently_used_images_are_evicted_first(tmp_path):
+    cache = ImageCache(str(tmp_path / "cache"), max_bytes=10)
+    dog = cache_image(cache, tmp_path, "dog", b"dog!")
+    cat = cache_image(cache, tmp_path, "cat", b"cat!")
+    # using the dog makes the cat the least recently used
+    assert cache.get(dog, str(tmp_path / "out.jpg"))
+
+    owl = cache_image(cache, tmp_path, "owl", b"owl!")
+
+    assert not cache.get(cat, str(tmp_path / "out.jpg"))
+    assert cache.get(dog, str(tmp_path / "out.jpg"))
+    assert cache.get(owl, str(tmp_path / "out.jpg"))
+    assert cache.total_bytes == 8
+    assert not os.path.exists(os.path.join(cache.directory, f"{cat}.jpg"))
+
+
+def test_the_index_is_reloaded_with_its_order(tmp_path):
+    cache = ImageCache(str(tmp_path / "cache"), max_bytes=10)
+    dog = cache_image(cache, tmp_path, "dog", b"dog!")
+    cat = cache_image(cache, tmp_path, "cat", b"cat!")
+    assert cache.get(dog, str(tmp_path / "out.jpg"))
+
+    reloaded = ImageCache(cache.directory, max_bytes=10)
+    cache_image(reloaded, tmp_path, "owl", b"owl!")
+
+    assert reloaded.get(dog, str(tmp_path / "out.jpg"))
+    assert not reloaded.get(cat, str(tmp_path / "out.jpg"))
+
+
+def test_a_damaged_or_missing_image_is_a_miss(tmp_path):
+    cache = ImageCache(str(tmp_path / "cache"))
+    dog = cache_image(cache, tmp_path, "dog", b"a dog")
+    cat = cache_image(cache, tmp_path, "cat", b"a cat")
+    write(os.path.join(cache.directory, f"{dog}.jpg"), b"a do")
+    os.remove(os.path.join(cache.directory, f"{cat}.jpg"))
+
+    assert not cache.get(dog, str(tmp_path / "out.jpg"))
+    assert not cache.get(cat, str(tmp_path / "out.jpg"))
+    assert cache.stats()["entries"] == 0
+
+
+def test_a_damaged_index_starts_an_empty_cache(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    write(directory / INDEX_FILE, b"{not json")
+
+    assert ImageCache(str(directory)).stats()["entries"] == 0
+
+
+def test_an_image_that_doesnt_match_its_checksum_isnt_cached(tmp_path):
+    cache = ImageCache(str(tmp_path / "cache"))
+    path = write(tmp_path / "dog.jpg", b"a dog")
+
+    with pytest.raises(ValueError):
+        cache.put("dog", path, sha256="0" * 64)
+    assert not cache.get("dog", str(tmp_path / "out.jpg"))
@@ -0,0 +1,27 @@
+import threading
+import pytest
+
+pytest.importorskip("langchain_openai")
+
+from lib.llm_backends import Backend, LLMRegistry  # noqa: E402
+
+
+def test_runs_starting_together_share_one_model_per_backend():
+    registry = LLMRegistry(
+        [Backend("large", "gpt-4-turbo", api_key="NA", max_concurrency=2)]
+    )
+    barrier = threading.Barrier(8)
+    llms = []
+
+    def route():
+        barrier.wait()
+        llms.append(registry.route("screenwriter"))
+
+    threads = [threading.Thread(target=route) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(llms) == 8
+    assert all(llm is llms[0] for llm in llms)
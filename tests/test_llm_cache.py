@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip("langchain_openai")
+
+from langchain_core.callbacks import BaseCallbackHandler  # noqa: E402
+from lib.fixtures import FixtureServer  # noqa: E402
+from lib.llm_cache import CachedChatOpenAI, SQLiteCompletionCache  # noqa: E402
+
+
+class TokenCounter(BaseCallbackHandler):
+    def __init__(self):
+        self.tokens = 0
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.tokens += 1
+
+
+@pytest.fixture
+def server(tmp_path):
+    with FixtureServer(str(tmp_path / "fixtures"), synthesize=True) as server:
+        yield server
+
+
+def test_cache_misses_stream_and_hits_come_back_whole(server, tmp_path):
+    cache = SQLiteCompletionCache(str(tmp_path / "llm.sqlite"))
+    counter = TokenCounter()
+    llm = CachedChatOpenAI(
+        model="gpt-4-turbo",
+        base_url=server.openai_base_url,
+        api_key="NA",
+        cache=cache,
+        callbacks=[counter],
+    )
+
+    missed = list(llm.stream("Write the first act"))
+    assert counter.tokens > 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["entries"] == 1
+
+    counter.tokens = 0
+    hit = list(llm.stream("Write the first act"))
+    assert counter.tokens == 0
+    assert cache.stats()["hits"] == 1
+    assert hit[0].content == missed[0].content
+
+    # streaming doesn't change the cache key
+    assert llm.invoke("Write the first act").content == missed[0].content
+    assert cache.stats()["hits"] == 2
@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+from lib.manifest import Manifest
+
+
+def agent(model="gpt-4-turbo"):
+    return SimpleNamespace(
+        role="Screenwriter",
+        goal="Write the script",
+        backstory="A master of the genre",
+        llm=SimpleNamespace(model_name=model),
+        tools=[],
+    )
+
+
+def task(movie_dir, name, context=(), description=None, **fields):
+    fields = {"agent": agent(), "tools": [], "output": None, **fields}
+    return SimpleNamespace(
+        description=description or f"Write the {name}",
+        expected_output=f"The {name}",
+        context=list(context),
+        output_file=str(movie_dir / f"{name}.md"),
+        **fields,
+    )
+
+
+def write(task, text):
+    with open(task.output_file, "w") as f:
+        f.write(text)
+
+
+def run(manifest, task, text):
+    write(task, text)
+    manifest.record(task, manifest.fingerprint(task))
+
+
+def test_a_recorded_task_is_fresh_until_its_prompt_changes(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    treatment = task(tmp_path, "treatment")
+    run(manifest, treatment, "A heist on the moon")
+
+    assert manifest.is_fresh(treatment, manifest.fingerprint(treatment))
+
+    treatment.description = "Write the treatment, with more jokes"
+    assert not manifest.is_fresh(treatment, manifest.fingerprint(treatment))
+
+
+def test_a_missing_output_file_is_stale(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    treatment = task(tmp_path, "treatment")
+    run(manifest, treatment, "A heist on the moon")
+
+    (tmp_path / "treatment.md").unlink()
+
+    assert not manifest.is_fresh(treatment, manifest.fingerprint(treatment))
+
+
+def test_fingerprints_cover_the_model_and_extra_inputs(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    treatment = task(tmp_path, "treatment")
+    fingerprint = manifest.fingerprint(treatment)
+
+    assert fingerprint == manifest.fingerprint(treatment, context_tokens=None)
+    assert fingerprint != manifest.fingerprint(treatment, context_tokens=1000)
+    treatment.agent = agent(model="gpt-3.5-turbo")
+    assert fingerprint != manifest.fingerprint(treatment)
+
+
+def test_a_changed_output_makes_every_descendant_stale(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    treatment = task(tmp_path, "treatment")
+    act = task(tmp_path, "first_act", [treatment])
+    storyboard = task(tmp_path, "first_act_storyboard", [act])
+    run(manifest, treatment, "A heist on the moon")
+    run(manifest, act, "INT. MOON BASE")
+    run(manifest, storyboard, "Shot 1: the moon base")
+
+    write(treatment, "A heist on Mars")
+
+    assert not manifest.is_fresh(act, manifest.fingerprint(act))
+    # the storyboard only goes stale once the act it's built on is rewritten
+    assert manifest.is_fresh(storyboard, manifest.fingerprint(storyboard))
+    run(manifest, act, "INT. MARS BASE")
+    assert not manifest.is_fresh(storyboard, manifest.fingerprint(storyboard))
+
+
+def test_an_unchanged_rerun_keeps_descendants_fresh(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    treatment = task(tmp_path, "treatment")
+    act = task(tmp_path, "first_act", [treatment])
+    run(manifest, treatment, "A heist on the moon")
+    run(manifest, act, "INT. MOON BASE")
+
+    run(manifest, treatment, "A heist on the moon")
+
+    assert manifest.is_fresh(act, manifest.fingerprint(act))
+
+
+def test_the_manifest_is_reloaded_from_the_movie_directory(tmp_path):
+    treatment = task(tmp_path, "treatment")
+    shots = task(tmp_path, "first_act_storyboard", [treatment], agent=None)
+    manifest = Manifest(str(tmp_path))
+    run(manifest, treatment, "A heist on the moon")
+    run(manifest, shots, "[]")
+
+    reloaded = Manifest(str(tmp_path))
+
+    assert reloaded.is_fresh(treatment, reloaded.fingerprint(treatment))
+    assert reloaded.is_fresh(shots, reloaded.fingerprint(shots))
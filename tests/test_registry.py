@@ -0,0 +1,55 @@
+from lib.registry import Registry, parse_registry, registry_key
+
+REGISTRY = """Here is the registry.
+
+## Characters
+tiger: Tiger Jones, a tall woman in a red leather jacket
+- **Little Bean (Lola)**: a white chihuahua in a pink sweater
+2. Doc-Ock: a man with four mechanical arms
+
+## Locations
+neon_bar: a cramped bar lit in pink and blue neon
+
+## Style
+Bright and colorful,
+like a comic book.
+"""
+
+
+def test_parse_registry_reads_every_entry_and_the_style():
+    registry = parse_registry(REGISTRY)
+
+    assert registry.characters == {
+        "tiger": "Tiger Jones, a tall woman in a red leather jacket",
+        "little_bean_lola": "a white chihuahua in a pink sweater",
+        "doc_ock": "a man with four mechanical arms",
+    }
+    assert registry.locations == {"neon_bar": "a cramped bar lit in pink and blue neon"}
+    assert registry.style == "Bright and colorful, like a comic book."
+
+
+def test_keys_ignore_case_and_punctuation():
+    assert registry_key("Little Bean (Lola)") == "little_bean_lola"
+    assert registry_key(" neon-bar ") == "neon_bar"
+
+
+def test_expand_fills_in_references_and_adds_the_style():
+    registry = parse_registry(REGISTRY)
+
+    prompt = registry.expand(
+        "{char:Little Bean (Lola)} barks at {char: tiger} in {loc:neon_bar}."
+    )
+
+    assert prompt == (
+        "a white chihuahua in a pink sweater barks at Tiger Jones, a tall woman "
+        "in a red leather jacket in a cramped bar lit in pink and blue neon. "
+        "Bright and colorful, like a comic book."
+    )
+
+
+def test_expand_names_references_that_arent_registered():
+    registry = Registry(characters={"tiger": "a tall woman"})
+
+    assert registry.expand("{char:tiger} meets {char:the_mayor}") == (
+        "a tall woman meets the mayor"
+    )
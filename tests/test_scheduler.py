@@ -0,0 +1,23 @@
+import pytest
+from lib.scheduler import run_dag
+
+
+def test_nodes_waiting_for_a_worker_dont_run_after_a_failure():
+    ran = []
+
+    def run(node):
+        ran.append(node)
+        if node == "a":
+            raise ValueError("a failed")
+
+    with pytest.raises(ValueError):
+        run_dag(["a", "b", "c", "d"], lambda node: [], run, max_workers=1)
+
+    assert ran == ["a"]
+
+
+def test_results_come_back_in_list_order():
+    deps = {"a": [], "b": ["a"], "c": ["a"]}
+    results = run_dag(["c", "b", "a"], lambda node: deps[node], str.upper)
+
+    assert results == ["C", "B", "A"]
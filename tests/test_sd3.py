@@ -0,0 +1,165 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from lib.sd3 import ImageGenerator
+
+IMAGE = b"\xff\xd8\xff\xe0" + b"image" * 100
+
+
+# Serves POSTs with respond(handler), a function that writes the response, and
+# counts the connections made to it.
+@pytest.fixture
+def server():
+    servers = []
+
+    def start(respond):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with lock:
+                    httpd.connections += 1
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("content-length", 0)))
+                with lock:
+                    httpd.requests += 1
+                    count = httpd.requests
+                respond(self, count)
+
+            def log_message(self, *args):
+                pass
+
+        lock = threading.Lock()
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        httpd.daemon_threads = True
+        httpd.connections = 0
+        httpd.requests = 0
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        servers.append(httpd)
+        host, port = httpd.server_address[:2]
+        return httpd, f"http://{host}:{port}/sd3"
+
+    yield start
+    for httpd in servers:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def send_image(handler, body=IMAGE, length=None, close=False):
+    handler.send_response(200)
+    handler.send_header("content-type", "image/jpeg")
+    handler.send_header("content-length", str(length or len(body)))
+    if close:
+        handler.send_header("connection", "close")
+        handler.close_connection = True
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def test_stats_count_connections_a_server_closes(server, tmp_path):
+    httpd, url = server(lambda handler, count: send_image(handler, close=True))
+    generator = ImageGenerator("key", url=url, max_workers=1)
+
+    for i in range(5):
+        generator.run(f"shot {i}", str(tmp_path / f"{i}.jpg"))
+
+    assert httpd.connections == 5
+    stats = generator.stats()
+    assert stats["connections"] == 5
+    assert stats["reused_connections"] == 0
+
+
+def test_stats_count_reused_keep_alive_connections(server, tmp_path):
+    httpd, url = server(lambda handler, count: send_image(handler))
+    generator = ImageGenerator("key", url=url, max_workers=1)
+
+    for i in range(5):
+        generator.run(f"shot {i}", str(tmp_path / f"{i}.jpg"))
+
+    assert httpd.connections == 1
+    stats = generator.stats()
+    assert stats["connections"] == 1
+    assert stats["reused_connections"] == 4
+
+
+def test_the_api_key_isnt_logged(server, tmp_path, capsys):
+    _, url = server(lambda handler, count: send_image(handler))
+    generator = ImageGenerator("sk-secret", url=url)
+
+    generator.run("a dog in glasses", str(tmp_path / "dog.jpg"))
+
+    assert "sk-secret" not in capsys.readouterr().out
+
+
+def test_rate_limited_requests_wait_as_long_as_retry_after_says(
+    server, tmp_path, monkeypatch
+):
+    def respond(handler, count):
+        if count == 1:
+            handler.send_response(429)
+            handler.send_header("retry-after", "3")
+            handler.send_header("content-length", "0")
+            handler.end_headers()
+        else:
+            send_image(handler)
+
+    _, url = server(respond)
+    delays = []
+    monkeypatch.setattr("lib.sd3.time.sleep", delays.append)
+    generator = ImageGenerator("key", url=url)
+
+    generator.run("a dog in glasses", str(tmp_path / "dog.jpg"))
+
+    assert delays == [3.0]
+    assert (tmp_path / "dog.jpg").read_bytes() == IMAGE
+    assert generator.stats()["requests"] == 2
+    assert generator.stats()["retries"] == 1
+
+
+def test_retry_after_can_be_a_date():
+    generator = ImageGenerator("key")
+
+    class Response:
+        headers = {"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}
+
+    assert generator._retry_after(Response()) == 0.0
+    Response.headers = {"retry-after": "soon"}
+    assert generator._retry_after(Response()) is None
+
+
+def test_a_truncated_download_is_retried(server, tmp_path, monkeypatch):
+    def respond(handler, count):
+        if count == 1:
+            # promise the whole image, send half of it, and hang up
+            send_image(handler, IMAGE[: len(IMAGE) // 2], len(IMAGE), close=True)
+        else:
+            send_image(handler)
+
+    _, url = server(respond)
+    monkeypatch.setattr("lib.sd3.time.sleep", lambda delay: None)
+    generator = ImageGenerator("key", url=url)
+
+    generator.run("a dog in glasses", str(tmp_path / "dog.jpg"))
+
+    assert (tmp_path / "dog.jpg").read_bytes() == IMAGE
+    assert generator.stats()["retries"] == 1
+
+
+def test_a_rejected_request_isnt_retried(server, tmp_path):
+    def respond(handler, count):
+        body = b'{"errors": ["bad prompt"]}'
+        handler.send_response(400)
+        handler.send_header("content-type", "application/json")
+        handler.send_header("content-length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    httpd, url = server(respond)
+    generator = ImageGenerator("key", url=url)
+
+    with pytest.raises(Exception, match="bad prompt"):
+        generator.run("a dog in glasses", str(tmp_path / "dog.jpg"))
+    assert httpd.requests == 1
+    assert not (tmp_path / "dog.jpg").exists()
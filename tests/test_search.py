@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+from lib.documents import DocumentStore
+from lib.search import SearchIndex, split_passages, tokenize
+
+LOOKBOOK = """# Lookbook
+
+## Costumes
+
+Tiger wears a red leather jacket and silver boots in every scene.
+
+## Palette
+
+Neon pink and electric blue, with deep shadows.
+"""
+
+TREATMENT = """# Treatment
+
+## Characters
+
+Tiger is a retired safecracker. Her partner Doc plans the heist.
+
+## Setting
+
+A casino on the moon.
+"""
+
+
+def write(directory, name, text):
+    path = directory / name
+    path.write_text(text)
+    return str(path)
+
+
+def locations(passages):
+    return [passage.location for passage in passages]
+
+
+def test_tokenize_drops_stopwords_and_folds_plurals():
+    assert tokenize("The Costumes of the heists") == ["costume", "heist"]
+
+
+def test_passages_know_the_headings_theyre_under(tmp_path):
+    write(tmp_path, "lookbook.md", LOOKBOOK)
+    document = DocumentStore(str(tmp_path)).document("lookbook.md")
+
+    assert locations(split_passages(document)) == [
+        "lookbook.md > Lookbook > Costumes",
+        "lookbook.md > Lookbook > Palette",
+    ]
+
+
+def test_the_best_matching_passages_come_first(tmp_path):
+    write(tmp_path, "lookbook.md", LOOKBOOK)
+    write(tmp_path, "treatment.md", TREATMENT)
+    index = SearchIndex(DocumentStore(str(tmp_path)))
+
+    results = index.search("Tiger's costume", k=2)
+
+    assert locations(results) == [
+        "lookbook.md > Lookbook > Costumes",
+        "treatment.md > Treatment > Characters",
+    ]
+    assert locations(index.search("moon casino", k=1)) == [
+        "treatment.md > Treatment > Setting"
+    ]
+    assert index.search("submarine") == []
+
+
+def test_a_rewritten_document_is_reindexed(tmp_path):
+    write(tmp_path, "lookbook.md", LOOKBOOK)
+    index = SearchIndex(DocumentStore(str(tmp_path)))
+    assert index.search("jacket")
+
+    write(tmp_path, "lookbook.md", LOOKBOOK.replace("jacket", "trench coat, long"))
+
+    assert index.search("jacket") == []
+    assert locations(index.search("trench coat")) == [
+        "lookbook.md > Lookbook > Costumes"
+    ]
+
+
+def test_a_deleted_document_drops_out_of_the_index(tmp_path):
+    write(tmp_path, "lookbook.md", LOOKBOOK)
+    path = write(tmp_path, "treatment.md", TREATMENT)
+    index = SearchIndex(DocumentStore(str(tmp_path)))
+    assert index.search("safecracker")
+
+    (tmp_path / "treatment.md").unlink()
+    index.update(path)
+
+    assert index._documents.keys() == {"lookbook.md"}
+    assert index.search("safecracker") == []
+
+
+def test_a_finished_task_indexes_its_output(tmp_path):
+    index = SearchIndex(DocumentStore(str(tmp_path)))
+    path = write(tmp_path, "treatment.md", TREATMENT)
+
+    index.on_event(
+        SimpleNamespace(kind="task", phase="end", data={"output_file": path})
+    )
+
+    assert index._documents.keys() == {"treatment.md"}
+    assert locations(index.search("safecracker", k=1)) == [
+        "treatment.md > Treatment > Characters"
+    ]
@@ -0,0 +1,44 @@
+from lib.storyboard import parse_storyboard
+
+STORYBOARD = """# First act storyboard
+
+An overview of the act, before any of its shots.
+
+## Shot 1
+Characters: Tiger
+Location: Kitchen
+
+Tiger knocks a mug off the counter.
+
+## Shot 2
+Characters: Little Bean, Tiger
+
+Little Bean barks at Tiger.
+
+## Notes
+
+Keep the kitchen lit by one flickering bulb.
+"""
+
+
+def test_headings_before_the_first_shot_are_not_shots():
+    storyboard = parse_storyboard(STORYBOARD, "first")
+
+    assert [shot.id for shot in storyboard.shots] == ["1", "2"]
+    assert storyboard.shots[0].description == "Tiger knocks a mug off the counter."
+    assert storyboard.shots[1].description == "Little Bean barks at Tiger."
+
+
+def test_headings_without_shot_numbers_are_numbered_in_order():
+    storyboard = parse_storyboard("## Kitchen\n\nA mug falls.\n\n## Roof\n\nRain.", "1")
+
+    assert [shot.id for shot in storyboard.shots] == ["1", "2"]
+
+
+def test_storyboard_without_headings_is_one_shot_per_paragraph():
+    storyboard = parse_storyboard("A mug falls.\n\nRain on the roof.", "first")
+
+    assert [shot.description for shot in storyboard.shots] == [
+        "A mug falls.",
+        "Rain on the roof.",
+    ]